@@ -0,0 +1,103 @@
+import sys
+import time
+import tracemalloc
+
+import main
+from lexer import Lexer
+from parser import Parser, ForNode, FuncDefNode, walk
+
+
+ITERATIONS = 200000
+LONG_ITERATIONS = 10000000
+
+PROGRAMS = {
+    'arithmetic': (f'var t = 0\nfor i = 0 to {ITERATIONS} then\n  var t = t + i * 2 - i / 4 + 1\nend\nt', ITERATIONS),
+    'comparison': (f'var c = 0\nfor i = 0 to {ITERATIONS} then\n  var c = c + (i < 500) * 3 - (i == 7)\nend\nc', ITERATIONS),
+    'power': (f'var t = 0\nfor i = 0 to {ITERATIONS} then\n  var t = (i ^ 2 - t) / 3\nend\nt', ITERATIONS),
+    'counting': (f'for i = 0 to {LONG_ITERATIONS} then\n  i\nend', LONG_ITERATIONS),
+    'counting_expr': (f'var l = for i = 0 to {LONG_ITERATIONS} then i\n0', LONG_ITERATIONS),
+    'fib': ('func fib(n) -> if n < 2 then n else fib(n - 1) + fib(n - 2)\nfib(22)', None),
+}
+
+
+
+
+def nodes_per_iteration(text):
+    '''
+    Counts the nodes evaluated by one pass through the body of the first
+    for loop in text, or returns None if there is no loop. The benchmark bodies are straight line code, so this
+    times the iteration count is the number of nodes the loop evaluates.
+    '''
+    tokens, error = Lexer('<benchmark>', text).gen_tokens()
+    ast = Parser(tokens).parse()
+    for node in walk(ast.node):
+        if isinstance(node, ForNode):
+            return len(list(walk(node.body_node)))
+    return None
+
+
+def generated_script(lines):
+    '''
+    A long straight line script with a for loop and an if block every ten
+    lines, for measuring the parser.
+    '''
+    parts = []
+    for i in range(lines):
+        parts.append(f'var x{i % 50} = (a + {i}) * b - f({i}, "s") / 2')
+        if i % 10 == 0:
+            parts.append(f'for j = 0 to {i} then output(j * 2)')
+            parts.append(f'if x{i % 50} > 3 then\n  output(x{i % 50})\nelse\n  output(-1)\nend')
+    return '\n'.join(parts)
+
+
+def count_nodes(node):
+    count = 0
+    for child in walk(node):
+        count += 1
+        if isinstance(child, FuncDefNode):
+            count += count_nodes(child.body_node)
+    return count
+
+
+def ast_memory(lines=20000):
+    '''
+    Prints the memory the AST of generated_script(lines) takes per node,
+    counting the nodes and the Positions and lists they hold, but not the
+    tokens.
+    '''
+    tokens, error = Lexer('<benchmark>', generated_script(lines)).gen_tokens()
+    tracemalloc.start()
+    ast = Parser(tokens).parse().node
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = count_nodes(ast)
+    print(f'ast memory   {nodes} nodes  {size / nodes:8.1f} bytes/node')
+
+
+def measure(text, backend):
+    start = time.perf_counter()
+    _, error = main.run('<benchmark>', text, backend=backend)
+    elapsed = time.perf_counter() - start
+    if error:
+        raise Exception(error.as_string())
+    return elapsed
+
+
+def run_benchmarks(backends):
+    for name, (text, iterations) in PROGRAMS.items():
+        nodes = nodes_per_iteration(text)
+        for backend in backends:
+            elapsed = measure(text, backend)
+            if nodes:
+                print(f'{name:<12} {backend:<12} {elapsed:8.3f}s  {elapsed / (nodes * iterations) * 1e9:8.1f} ns/node')
+            else:
+                print(f'{name:<12} {backend:<12} {elapsed:8.3f}s')
+
+
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['memory']:
+        ast_memory()
+    else:
+        run_benchmarks(sys.argv[1:] or ['interpreter'])
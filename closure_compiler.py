@@ -0,0 +1,324 @@
+from errors import RTError
+from constants import Constants
+from compiler import CompileError
+from interpreter import RuntimeResult, BaseFunction, Number, String, LinkedList
+from interpreter import RuntimeFailure, ReturnSignal, BreakSignal, ContinueSignal, short_circuit
+from interpreter import binary_operation
+
+
+
+
+class ClosureFunction(BaseFunction):
+    def __init__(self, name, body, arg_names, should_auto_return):
+        super().__init__(name)
+        self.body = body
+        self.arg_names = arg_names
+        self.should_auto_return = should_auto_return
+
+    def execute(self, args):
+        res = RuntimeResult()
+        exec_ctx = self.generate_new_context()
+
+        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
+        if res.should_return():
+            return res
+
+        try:
+            value = self.body(exec_ctx)
+        except ReturnSignal as signal:
+            return res.success(signal.value)
+        except RuntimeFailure as failure:
+            return res.failure(failure.error)
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+
+        return res.success(value if self.should_auto_return else Number.null)
+
+    def copy(self):
+        copy = ClosureFunction(self.name, self.body, self.arg_names, self.should_auto_return)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+
+
+def run_closure(program, context):
+    '''
+    Runs a closure produced by ClosureCompiler.compile and converts its
+    outcome back into a RuntimeResult, the way Interpreter.visit reports it.
+    '''
+    res = RuntimeResult()
+    try:
+        return res.success(program(context))
+    except RuntimeFailure as failure:
+        return res.failure(failure.error)
+    except ReturnSignal as signal:
+        return res.success_return(signal.value)
+    except BreakSignal:
+        return res.success_break()
+    except ContinueSignal:
+        return res.success_continue()
+
+
+
+
+class ClosureCompiler:
+    '''
+    Walks the AST once and turns every node into a Python closure taking a
+    Context. Operators, child closures and constants are bound when the
+    closure is built, so evaluating a node is a single Python call.
+    return, break, continue and runtime errors unwind through the signal
+    exceptions from interpreter.py instead of RuntimeResult flags.
+    '''
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_compile_method)
+        return method(node)
+
+    def no_compile_method(self, node):
+        raise CompileError(f'No compile_{type(node).__name__} method defined')
+
+    def compile_NumberNode(self, node):
+        value = Number(node.tok.value)
+
+        def number(context):
+            return value
+        return number
+
+    def compile_StringNode(self, node):
+        value = String(node.tok.value)
+
+        def string(context):
+            return value
+        return string
+
+    def compile_VarAccessNode(self, node):
+        var_name = node.var_name_tok.value
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def var_access(context):
+            value = context.symbol_table.get(var_name)
+            if not value:
+                raise RuntimeFailure(RTError(
+                    pos_start, pos_end,
+                    f"\'{var_name}\' is not defined",
+                    context
+                ))
+            return value.copy().set_pos(pos_start, pos_end).set_context(context)
+        return var_access
+
+    def compile_VarAssignNode(self, node):
+        var_name = node.var_name_tok.value
+        value_fn = self.compile(node.value_node)
+
+        def var_assign(context):
+            value = value_fn(context)
+            context.symbol_table.set(var_name, value)
+            return value
+        return var_assign
+
+    def compile_BinaryOperatorNode(self, node):
+        operator = node.operator
+        operation = binary_operation(operator)
+        if operation is None:
+            raise CompileError(f'Unsupported binary operator {operator}')
+
+        left_fn = self.compile(node.left_node)
+        right_fn = self.compile(node.right_node)
+        pos_start, pos_end = node.pos_start, node.pos_end
+        left_pos = node.left_node.pos_start, node.left_node.pos_end
+        right_pos = node.right_node.pos_start, node.right_node.pos_end
+
+        def binary_operator(context):
+            left = left_fn(context)
+            right = right_fn(context)
+            result, error = operation(left, right)
+            if error:
+                raise RuntimeFailure(error.locate(left_pos, right_pos, context))
+            return result.set_pos(pos_start, pos_end)
+
+        if operator.type != Constants.TOK_KEYWORD:
+            return binary_operator
+
+        keyword = operator.value
+
+        def short_circuit_operation(context):
+            left = left_fn(context)
+            result = short_circuit(keyword, left)
+            if result is not None:
+                return result
+            right = right_fn(context)
+            result, error = operation(left, right)
+            if error:
+                raise RuntimeFailure(error.locate(left_pos, right_pos, context))
+            return result.set_pos(pos_start, pos_end)
+        return short_circuit_operation
+
+    def compile_UnaryOperatorNode(self, node):
+        operand_fn = self.compile(node.node)
+        pos_start, pos_end = node.pos_start, node.pos_end
+        operand_pos = node.node.pos_start, node.node.pos_end
+
+        if node.operator.type == Constants.TOK_MINUS:
+            def negate(context):
+                num, error = operand_fn(context).multiplied_by(Number(-1))
+                if error:
+                    raise RuntimeFailure(error.locate(operand_pos, None, context))
+                return num.set_pos(pos_start, pos_end)
+            return negate
+
+        if node.operator.matches(Constants.TOK_KEYWORD, 'not'):
+            def logical_not(context):
+                num, error = operand_fn(context).notted()
+                if error:
+                    raise RuntimeFailure(error.locate(operand_pos, None, context))
+                return num.set_pos(pos_start, pos_end)
+            return logical_not
+
+        raise CompileError(f'Unsupported unary operator {node.operator}')
+
+    def compile_ListNode(self, node):
+        element_fns = [self.compile(element_node) for element_node in node.element_nodes]
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def list_(context):
+            elements = [element_fn(context) for element_fn in element_fns]
+            return LinkedList(elements).set_context(context).set_pos(pos_start, pos_end)
+        return list_
+
+    def compile_IfNode(self, node):
+        cases = [
+            (self.compile(condition), self.compile(expr), should_return_null)
+            for condition, expr, should_return_null in node.cases
+        ]
+        if node.else_case:
+            else_expr, else_should_return_null = node.else_case
+            else_fn = self.compile(else_expr)
+        else:
+            else_fn, else_should_return_null = None, True
+
+        def if_(context):
+            for condition_fn, expr_fn, should_return_null in cases:
+                if condition_fn(context).is_true():
+                    value = expr_fn(context)
+                    return Number.null if should_return_null else value
+            if else_fn:
+                value = else_fn(context)
+                return Number.null if else_should_return_null else value
+            return Number.null
+        return if_
+
+    def compile_ForNode(self, node):
+        var_name = node.var_name_tok.value
+        start_fn = self.compile(node.start_value_node)
+        end_fn = self.compile(node.end_value_node)
+        step_fn = self.compile(node.step_value_node) if node.step_value_node else None
+        body_fn = self.compile(node.body_node)
+        should_return_null = node.should_return_null
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def for_(context):
+            i = start_fn(context).value
+            end_value = end_fn(context).value
+            step_value = step_fn(context).value if step_fn else 1
+            ascending = step_value >= 0
+            symbol_table = context.symbol_table
+            elements = []
+
+            while i < end_value if ascending else i > end_value:
+                symbol_table.set(var_name, Number(i))
+                i += step_value
+
+                try:
+                    value = body_fn(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if not should_return_null:
+                    elements.append(value)
+
+            if should_return_null:
+                return Number.null
+            return LinkedList(elements).set_context(context).set_pos(pos_start, pos_end)
+        return for_
+
+    def compile_WhileNode(self, node):
+        condition_fn = self.compile(node.condition_node)
+        body_fn = self.compile(node.body_node)
+        should_return_null = node.should_return_null
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def while_(context):
+            elements = []
+
+            while condition_fn(context).is_true():
+                try:
+                    value = body_fn(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if not should_return_null:
+                    elements.append(value)
+
+            if should_return_null:
+                return Number.null
+            return LinkedList(elements).set_context(context).set_pos(pos_start, pos_end)
+        return while_
+
+    def compile_FuncDefNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        body_fn = self.compile(node.body_node)
+        should_auto_return = node.should_auto_return
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def func_def(context):
+            func_value = ClosureFunction(func_name, body_fn, arg_names, should_auto_return).set_context(context).set_pos(pos_start, pos_end)
+            if func_name:
+                context.symbol_table.set(func_name, func_value)
+            return func_value
+        return func_def
+
+    def compile_CallNode(self, node):
+        callee_fn = self.compile(node.node_to_call)
+        arg_fns = [self.compile(arg_node) for arg_node in node.arg_nodes]
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def call(context):
+            value_to_call = callee_fn(context).copy().set_pos(pos_start, pos_end)
+            args = [arg_fn(context) for arg_fn in arg_fns]
+
+            res = value_to_call.execute(args)
+            if res.error:
+                raise RuntimeFailure(res.error)
+            if res.loop_should_break:
+                raise BreakSignal()
+            if res.loop_should_continue:
+                raise ContinueSignal()
+            return res.value.copy().set_pos(pos_start, pos_end).set_context(context)
+        return call
+
+    def compile_ReturnNode(self, node):
+        value_fn = self.compile(node.node_to_return) if node.node_to_return else None
+
+        def return_(context):
+            raise ReturnSignal(value_fn(context) if value_fn else Number.null)
+        return return_
+
+    def compile_ContinueNode(self, node):
+        def continue_(context):
+            raise ContinueSignal()
+        return continue_
+
+    def compile_BreakNode(self, node):
+        def break_(context):
+            raise BreakSignal()
+        return break_
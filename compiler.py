@@ -0,0 +1,288 @@
+from constants import Constants
+from interpreter import Number, String, binary_operation
+
+
+class OpCode:
+    LOAD_NAME = 0
+    LOAD_NUMBER = 1
+    LOAD_STRING = 2
+    LOAD_NULL = 3
+    STORE_NAME = 4
+    BINARY_OP = 5
+    UNARY_OP = 6
+    POP = 7
+    JUMP = 8
+    POP_JUMP_IF_FALSE = 9
+    BUILD_LIST = 10
+    FOR_PREP = 11
+    FOR_ITER = 12
+    SETUP_LOOP = 13
+    POP_BLOCK = 14
+    LIST_APPEND = 15
+    BUILD_LOOP_LIST = 16
+    BREAK = 17
+    CONTINUE = 18
+    MAKE_FUNCTION = 19
+    CALL = 20
+    RETURN = 21
+    END = 22
+    NEW_LOOP_LIST = 23
+    TAIL_CALL = 24
+    JUMP_IF_SHORT_CIRCUIT = 25
+
+
+
+
+class CompileError(Exception):
+    pass
+
+
+def positions(node):
+    return node.pos_start, node.pos_end
+
+
+
+
+class CodeObject:
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+
+    def emit(self, op, arg=None, pos_start=None, pos_end=None):
+        self.instructions.append((op, arg, pos_start, pos_end))
+        return len(self.instructions) - 1
+
+    def patch(self, index, arg):
+        op, _, pos_start, pos_end = self.instructions[index]
+        self.instructions[index] = (op, arg, pos_start, pos_end)
+
+    def next_index(self):
+        return len(self.instructions)
+
+    def __repr__(self):
+        return f'<code {self.name}, {len(self.instructions)} instructions>'
+
+
+
+
+class Loop:
+    def __init__(self, continue_target):
+        self.continue_target = continue_target
+        self.break_jumps = []
+
+
+
+
+class Compiler:
+    '''
+    Lowers the AST produced by the Parser into flat CodeObjects that the VM
+    executes. Anything the VM can not reproduce exactly raises CompileError,
+    so the caller can fall back to the tree walking Interpreter.
+    '''
+    def __init__(self):
+        self.loops = []
+
+    def compile(self, node, name='<program>'):
+        code = CodeObject(name)
+        self.visit(node, code)
+        code.emit(OpCode.END)
+        return code
+
+    def visit(self, node, code):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_compile_method)
+        method(node, code)
+
+    def no_compile_method(self, node, code):
+        raise CompileError(f'No compile_{type(node).__name__} method defined')
+
+    def compile_NumberNode(self, node, code):
+        code.emit(OpCode.LOAD_NUMBER, Number(node.tok.value), node.pos_start, node.pos_end)
+
+    def compile_StringNode(self, node, code):
+        code.emit(OpCode.LOAD_STRING, String(node.tok.value), node.pos_start, node.pos_end)
+
+    def compile_VarAccessNode(self, node, code):
+        code.emit(OpCode.LOAD_NAME, node.var_name_tok.value, node.pos_start, node.pos_end)
+
+    def compile_VarAssignNode(self, node, code):
+        self.visit(node.value_node, code)
+        code.emit(OpCode.STORE_NAME, node.var_name_tok.value)
+
+    def compile_BinaryOperatorNode(self, node, code):
+        operator = node.operator
+        operation = binary_operation(operator)
+        if operation is None:
+            raise CompileError(f'Unsupported binary operator {operator}')
+
+        self.visit(node.left_node, code)
+        if operator.type == Constants.TOK_KEYWORD:
+            # and / or skip the right operand when the left one decides
+            short_circuit_jump = code.emit(OpCode.JUMP_IF_SHORT_CIRCUIT)
+        self.visit(node.right_node, code)
+        code.emit(
+            OpCode.BINARY_OP,
+            (operation, positions(node.left_node), positions(node.right_node)),
+            node.pos_start, node.pos_end
+        )
+        if operator.type == Constants.TOK_KEYWORD:
+            code.patch(short_circuit_jump, (operator.value, code.next_index()))
+
+    def compile_UnaryOperatorNode(self, node, code):
+        if node.operator.type == Constants.TOK_MINUS:
+            operation = 'neg'
+        elif node.operator.matches(Constants.TOK_KEYWORD, 'not'):
+            operation = 'not'
+        else:
+            raise CompileError(f'Unsupported unary operator {node.operator}')
+
+        self.visit(node.node, code)
+        code.emit(OpCode.UNARY_OP, (operation, positions(node.node)), node.pos_start, node.pos_end)
+
+    def compile_ListNode(self, node, code):
+        for element_node in node.element_nodes:
+            self.visit(element_node, code)
+        code.emit(OpCode.BUILD_LIST, len(node.element_nodes), node.pos_start, node.pos_end)
+
+    def compile_IfNode(self, node, code):
+        end_jumps = []
+
+        for condition, expr, should_return_null in node.cases:
+            self.visit(condition, code)
+            next_case = code.emit(OpCode.POP_JUMP_IF_FALSE)
+            self.compile_branch(expr, should_return_null, code)
+            end_jumps.append(code.emit(OpCode.JUMP))
+            code.patch(next_case, code.next_index())
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.compile_branch(expr, should_return_null, code)
+        else:
+            code.emit(OpCode.LOAD_NULL)
+
+        for index in end_jumps:
+            code.patch(index, code.next_index())
+
+    def compile_branch(self, expr, should_return_null, code):
+        self.visit(expr, code)
+        if should_return_null:
+            code.emit(OpCode.POP)
+            code.emit(OpCode.LOAD_NULL)
+
+    def compile_ForNode(self, node, code):
+        if not node.should_return_null:
+            code.emit(OpCode.NEW_LOOP_LIST)
+
+        self.visit(node.start_value_node, code)
+        self.visit(node.end_value_node, code)
+        if node.step_value_node:
+            self.visit(node.step_value_node, code)
+        else:
+            code.emit(OpCode.LOAD_NUMBER, Number(1))
+        code.emit(OpCode.FOR_PREP)
+        code.emit(OpCode.SETUP_LOOP)
+
+        loop = Loop(code.next_index())
+        exit_jump = code.emit(OpCode.FOR_ITER, (node.var_name_tok.value, None))
+        self.compile_loop_body(node, loop, 2, code)
+        code.emit(OpCode.JUMP, loop.continue_target)
+
+        code.patch(exit_jump, (node.var_name_tok.value, code.next_index()))
+        self.finish_loop(loop, code)
+        code.emit(OpCode.POP)
+        self.finish_loop_value(node, code)
+
+    def compile_WhileNode(self, node, code):
+        if not node.should_return_null:
+            code.emit(OpCode.NEW_LOOP_LIST)
+        code.emit(OpCode.SETUP_LOOP)
+
+        loop = Loop(code.next_index())
+        self.visit(node.condition_node, code)
+        exit_jump = code.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_loop_body(node, loop, 1, code)
+        code.emit(OpCode.JUMP, loop.continue_target)
+
+        code.patch(exit_jump, code.next_index())
+        self.finish_loop(loop, code)
+        self.finish_loop_value(node, code)
+
+    def compile_loop_body(self, node, loop, list_offset, code):
+        self.loops.append(loop)
+        self.visit(node.body_node, code)
+        self.loops.pop()
+
+        if node.should_return_null:
+            code.emit(OpCode.POP)
+        else:
+            code.emit(OpCode.LIST_APPEND, list_offset)
+
+    def finish_loop(self, loop, code):
+        for index in loop.break_jumps:
+            code.patch(index, code.next_index())
+        code.emit(OpCode.POP_BLOCK)
+
+    def finish_loop_value(self, node, code):
+        if node.should_return_null:
+            code.emit(OpCode.LOAD_NULL)
+        else:
+            code.emit(OpCode.BUILD_LOOP_LIST, None, node.pos_start, node.pos_end)
+
+    def compile_BreakNode(self, node, code):
+        if not self.loops:
+            raise CompileError('break outside of a loop')
+        self.loops[-1].break_jumps.append(code.emit(OpCode.BREAK))
+
+    def compile_ContinueNode(self, node, code):
+        if not self.loops:
+            raise CompileError('continue outside of a loop')
+        code.emit(OpCode.CONTINUE, self.loops[-1].continue_target)
+
+    def compile_ReturnNode(self, node, code):
+        if node.node_to_return:
+            self.visit(node.node_to_return, code)
+        else:
+            code.emit(OpCode.LOAD_NULL)
+        code.emit(OpCode.RETURN)
+
+    def compile_FuncDefNode(self, node, code):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+
+        outer_loops = self.loops
+        self.loops = []
+        body_code = self.compile(node.body_node, func_name or '<anonymous>')
+        self.loops = outer_loops
+        self.mark_tail_calls(body_code, node.should_auto_return)
+
+        code.emit(
+            OpCode.MAKE_FUNCTION,
+            (func_name, body_code, arg_names, node.should_auto_return),
+            node.pos_start, node.pos_end
+        )
+        if func_name:
+            code.emit(OpCode.STORE_NAME, func_name)
+
+    def mark_tail_calls(self, code, should_auto_return):
+        '''
+        Turns every CALL whose result the function returns unchanged into a
+        TAIL_CALL. That is a CALL followed, possibly through JUMPs, by
+        RETURN, or by END when the function auto returns its body's value.
+        '''
+        instructions = code.instructions
+        for index, (op, arg, pos_start, pos_end) in enumerate(instructions):
+            if op != OpCode.CALL:
+                continue
+
+            next_op, next_arg, _, _ = instructions[index + 1]
+            while next_op == OpCode.JUMP:
+                next_op, next_arg, _, _ = instructions[next_arg]
+
+            if next_op == OpCode.RETURN or (next_op == OpCode.END and should_auto_return):
+                instructions[index] = (OpCode.TAIL_CALL, arg, pos_start, pos_end)
+
+    def compile_CallNode(self, node, code):
+        self.visit(node.node_to_call, code)
+        for arg_node in node.arg_nodes:
+            self.visit(arg_node, code)
+        code.emit(OpCode.CALL, len(node.arg_nodes), node.pos_start, node.pos_end)
@@ -29,9 +29,22 @@ class InvalidSyntaxError(Error):
 
 
 class RTError(Error):
-    def __init__(self, pos_start, pos_end, details, context):
+    '''
+    Errors raised by Number and String operations have no position or
+    context, because those values carry neither. The evaluator fills them in
+    with locate(), using the left operand unless operand is 'right'.
+    '''
+    def __init__(self, pos_start, pos_end, details, context, operand=None):
         super().__init__(pos_start, pos_end, 'Runtime Error', details)
         self.context=context
+        self.operand = operand
+
+    def locate(self, left_pos, right_pos, context):
+        if self.pos_start is None:
+            self.pos_start, self.pos_end = right_pos if self.operand == 'right' else left_pos
+        if self.context is None:
+            self.context = context
+        return self
 
     def as_string(self):
         result= self.generate_traceback()
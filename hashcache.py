@@ -0,0 +1,240 @@
+import gc
+import io
+import os
+import re
+import pickle
+import copyreg
+import hashlib
+from collections import OrderedDict
+
+from lexer import Source, Position, Token
+
+
+CACHE_DIR = '__hashcache__'
+
+# Modules whose code decides what a parsed and resolved program looks like,
+# or how it is pickled. A change to any of them invalidates every cached
+# program.
+AST_MODULES = (
+    'constants.py', 'lexer.py', 'parser.py', 'optimizer.py', 'resolver.py',
+    'interpreter.py', 'hashcache.py',
+)
+
+# Programs that parse faster than this are not cached. Writing and reading
+# the cache file would cost about as much as parsing them again.
+MIN_PARSE_SECONDS = 0.05
+
+
+def interpreter_version(package_dir=None):
+    digest = hashlib.sha256()
+    if package_dir is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in AST_MODULES:
+        with open(os.path.join(package_dir, module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+INTERPRETER_VERSION = interpreter_version()
+
+
+
+
+# Cached programs live in a __hashcache__ directory next to the script, in
+# <script name>.<INTERPRETER_VERSION>.pickle, or .unfolded.pickle when it was
+# parsed without constant folding. The file starts with a small pickle of
+# (INTERPRETER_VERSION, source digest), followed by the pickled AST as it is
+# after the Resolver, before anything has run. The Source the AST's
+# Positions point to is left out and supplied again on load, so the cache
+# does not hold a second copy of the script.
+
+def cache_path(fname, fold_constants=True):
+    if not os.path.isfile(fname):
+        return None
+    directory, name = os.path.split(fname)
+    variant = '' if fold_constants else '.unfolded'
+    return os.path.join(directory, CACHE_DIR, f'{name}.{INTERPRETER_VERSION}{variant}.pickle')
+
+
+def remove_stale(path):
+    '''
+    Deletes the files next to path that cache the same script for other
+    versions of the interpreter, which would never be read again.
+    '''
+    directory, name = os.path.split(path)
+    variant = '.unfolded' if name.endswith('.unfolded.pickle') else ''
+    script = name[:-len(f'.{INTERPRETER_VERSION}{variant}.pickle')]
+    stale = re.compile(re.escape(script) + r'\.[0-9a-f]{16}' + re.escape(variant) + r'\.pickle')
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for other in names:
+        if other != name and stale.fullmatch(other):
+            try:
+                os.remove(os.path.join(directory, other))
+            except OSError:
+                pass
+
+
+def source_digest(text):
+    if isinstance(text, str):
+        text = text.encode('utf-8', 'surrogatepass')
+    return hashlib.sha256(text).hexdigest()
+
+
+def loaded_source():
+    raise pickle.UnpicklingError('A cached AST can only be loaded by ASTUnpickler')
+
+
+def reduce_source(source):
+    return loaded_source, ()
+
+
+def reduce_position(position):
+    return Position, (position.idx, position.source, position.shift)
+
+
+def reduce_token(token):
+    return Token, (token.type, token.value, token.start, token.end, token.source)
+
+
+class ASTPickler(pickle.Pickler):
+    '''
+    Positions and Tokens, most of the objects in an AST, are pickled as
+    their constructor arguments instead of a dict of their slots, which is
+    faster and smaller. The Source is replaced by a reference to
+    loaded_source, which ASTUnpickler resolves to the Source it is given.
+    Everything else is pickled as usual, without calling back into Python.
+    '''
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[Source] = reduce_source
+        self.dispatch_table[Position] = reduce_position
+        self.dispatch_table[Token] = reduce_token
+
+
+class ASTUnpickler(pickle.Unpickler):
+    def __init__(self, file, source):
+        super().__init__(file)
+        self.source = source
+
+    def find_class(self, module, name):
+        if module == __name__ and name == 'loaded_source':
+            return lambda: self.source
+        return super().find_class(module, name)
+
+
+def without_gc(function, *args):
+    '''
+    An AST is hundreds of thousands of small objects and pickling them
+    triggers the cyclic garbage collector over and over, which takes longer
+    than the pickling itself. None of them are garbage, so it is paused.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load(path, digest, source):
+    '''
+    Returns the AST cached at path if it was parsed from text with this
+    digest by this version of the interpreter, or None. A file that cannot
+    be unpickled, whatever the reason, is treated as missing.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != (INTERPRETER_VERSION, digest):
+                return None
+            return without_gc(ASTUnpickler(f, source).load)
+    except Exception:
+        return None
+
+
+def store(path, digest, node, parse_seconds):
+    '''
+    Writes node, which took parse_seconds to parse, to path and removes the
+    script's caches for other versions of the interpreter. A program that
+    parsed faster than MIN_PARSE_SECONDS is not worth caching. The cache
+    is only an optimisation, so a failure, like a read only directory, is
+    ignored.
+    '''
+    if parse_seconds < MIN_PARSE_SECONDS:
+        return
+    buffer = io.BytesIO()
+    try:
+        pickle.dump((INTERPRETER_VERSION, digest), buffer)
+        without_gc(ASTPickler(buffer).dump, node)
+    except (pickle.PicklingError, RecursionError):
+        return
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return
+    remove_stale(path)
+
+
+
+
+def file_key(fname):
+    '''
+    Identifies the current contents of the file fname without reading it,
+    or returns None if it is not a file.
+    '''
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    return ('file', os.path.abspath(fname), stat.st_mtime_ns, stat.st_size)
+
+
+def text_key(fname, text):
+    return ('text', fname, source_digest(text))
+
+
+class ParseCache:
+    '''
+    Keeps the last size programs parsed in this process, keyed by something
+    built from file_key or text_key, and evicts the least recently used one when full. A size of
+    0 turns it off. hits and misses count lookups.
+    '''
+    def __init__(self, size=64):
+        self.size = size
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        node = self.programs.get(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.programs.move_to_end(key)
+        return node
+
+    def set(self, key, node):
+        if self.size <= 0:
+            return
+        self.programs[key] = node
+        self.programs.move_to_end(key)
+        while len(self.programs) > self.size:
+            self.programs.popitem(last=False)
+
+    def clear(self):
+        self.programs.clear()
+        self.hits = 0
+        self.misses = 0
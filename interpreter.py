@@ -1,5 +1,8 @@
+import operator
+
 from errors import RTError
 from constants import Constants
+from pvector import PersistentVector
 
 
 
@@ -74,22 +77,97 @@ class RuntimeResult:
 
 
 
+class RuntimeFailure(Exception):
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
+class ReturnSignal(Exception):
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+class BreakSignal(Exception):
+    pass
+
+class ContinueSignal(Exception):
+    pass
+
+
+
+
+
 class SymbolTable:
-    def __init__(self, parent= None):
+    '''
+    layout maps the local names of a function, as computed by the Resolver,
+    to indices into self.slots. Names outside the layout live in self.symbols.
+    An empty slot holds None and, like a missing name, is looked up in the
+    parent table.
+
+    root is the table at the top of the chain and version counts the
+    changes to its symbols. local_names collects every name a table below
+    a root could hold: the names in each function's layout and any name set
+    in the symbols of a table with a parent. A name outside local_names can
+    only be found in the root, so the Interpreter caches lookups of such
+    globals and builtins on the VarAccessNode until version or
+    local_names_version changes.
+    '''
+    local_names = set()
+    local_names_version = 0
+
+    def __init__(self, parent= None, layout=None):
         self.symbols = {}
         self.parent = parent
+        self.layout = layout
+        self.slots = [None] * len(layout) if layout else None
+        self.root = parent.root if parent else self
+        self.version = 0
+
+    @classmethod
+    def add_local_names(cls, names):
+        if not cls.local_names.issuperset(names):
+            cls.local_names.update(names)
+            cls.local_names_version += 1
 
     def get(self, var_name):
-        value = self.symbols.get(var_name, None)
-        if value == None and self.parent:
+        table = self
+        while table:
+            slot = table.layout.get(var_name) if table.slots else None
+            if slot is None:
+                value = table.symbols.get(var_name, None)
+            else:
+                value = table.slots[slot]
+            if value is not None:
+                return value
+            table = table.parent
+        return None
+
+    def get_slot(self, slot, var_name):
+        value = self.slots[slot]
+        if value is None and self.parent:
             return self.parent.get(var_name)
         return value
 
     def set(self, name, value):
+        if self.slots:
+            slot = self.layout.get(name)
+            if slot is not None:
+                self.slots[slot] = value
+                return
+        if self.parent is not None and name not in SymbolTable.local_names:
+            SymbolTable.add_local_names((name,))
         self.symbols[name]=value
+        self.version += 1
+
+    def set_slot(self, slot, value):
+        self.slots[slot] = value
 
     def remove(self, name):
-        del self.symbols[name]
+        if self.slots and name in self.layout:
+            self.slots[self.layout[name]] = None
+        else:
+            del self.symbols[name]
+            self.version += 1
 
 
 
@@ -97,6 +175,11 @@ class SymbolTable:
 
 
 class Value:
+    __slots__ = ()
+    pos_start = None
+    pos_end = None
+    context = None
+
     def __init__(self):
         self.set_pos()
         self.set_context()
@@ -159,25 +242,45 @@ class Value:
 
 
 class Number(Value):
-    def __init__(self, value):
-        super().__init__()
-        self.value = value
+    '''
+    Numbers are immutable and carry no position or context, so they can be
+    shared freely instead of copied. Integers from SMALL_INT_MIN to
+    SMALL_INT_MAX are preallocated and Number() returns the shared instance.
+    '''
+    __slots__ = ('value',)
+    __init__ = object.__init__
+
+    def __new__(cls, value):
+        if type(value) is int and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+            return SMALL_INTS[value - SMALL_INT_MIN]
+        number = object.__new__(cls)
+        number.value = value
+        return number
+
+    def __getnewargs__(self):
+        return (self.value,)
+
+    def set_pos(self, pos_start=None, pos_end=None):
+        return self
+
+    def set_context(self, context=None):
+        return self
     
     def added_to(self, num):
         if isinstance(num, Number):
-            return Number(self.value+num.value).set_context(self.context), None
+            return Number(self.value+num.value), None
         else:
             return None, Value.illegal_operation(self, num)
 
     def subtracted_by(self, num):
         if isinstance(num, Number):
-            return Number(self.value-num.value).set_context(self.context), None
+            return Number(self.value-num.value), None
         else:
             return None, Value.illegal_operation(self, num)
 
     def multiplied_by(self, num):
         if isinstance(num, Number):
-            return Number(self.value*num.value).set_context(self.context), None
+            return Number(self.value*num.value), None
         else:
             return None, Value.illegal_operation(self, num)
 
@@ -187,69 +290,67 @@ class Number(Value):
                 return None, RTError(
                     num.pos_start, num.pos_end,
                     'Division by zero',
-                    self.context
+                    self.context,
+                    operand='right'
                 )
-            return Number(self.value/num.value).set_context(self.context), None
+            return Number(self.value/num.value), None
         else:
             return None, Value.illegal_operation(self, num)
 
     def powered_by(self, num):
         if isinstance(num, Number):
-            return Number(self.value ** num.value).set_context(self.context), None
+            return Number(self.value ** num.value), None
         else:
             return None, Value.illegal_operation(self, num)
 
     def compare_equals(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value == num.value)).set_context(self.context), None
+            return Number(int(self.value == num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def compare_not_equals(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value != num.value)).set_context(self.context), None
+            return Number(int(self.value != num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
 
     def compare_lt(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value < num.value)).set_context(self.context), None
+            return Number(int(self.value < num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def compare_gt(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value > num.value)).set_context(self.context), None
+            return Number(int(self.value > num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def compare_lte(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value <= num.value)).set_context(self.context), None
+            return Number(int(self.value <= num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def compare_gte(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value >= num.value)).set_context(self.context), None
+            return Number(int(self.value >= num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def and_to(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value and num.value)).set_context(self.context), None
+            return Number(int(self.value and num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     
     def or_to(self, num):
         if isinstance(num, Number):
-            return Number(int(self.value or num.value)).set_context(self.context), None
+            return Number(int(self.value or num.value)), None
         else:
             return None, Value.illegal_operation(self, num)
     def notted(self, num):
-        return Number(1 if self.value == 0 else 0).set_context(self.context), None
+        return Number(1 if self.value == 0 else 0), None
     
 
     def copy(self):
-        copy = Number(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+        return self
 
     def is_true(self):
         return self.value != 0
@@ -258,6 +359,13 @@ class Number(Value):
         return str(self.value)
 
 ############################ CREATING SOME CONSTANTS
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INTS = []
+for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1):
+    SMALL_INTS.append(object.__new__(Number))
+    SMALL_INTS[-1].value = i
+
 Number.null = Number(0)
 Number.true = Number(1)
 Number.false = Number(0)
@@ -265,19 +373,29 @@ Number.false = Number(0)
 
 
 class String(Value):
+    '''
+    Strings are immutable like Numbers and carry no position or context.
+    '''
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        super().__init__()
         self.value = value
 
+    def set_pos(self, pos_start=None, pos_end=None):
+        return self
+
+    def set_context(self, context=None):
+        return self
+
     def added_to(self, other):
         if isinstance(other, String):
-            return String(self.value + other.value).set_context(self.context), None
+            return String(self.value + other.value), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def multed_by(self, other):
         if isinstance(other, Number):
-            return String(self.value * other.value).set_context(self.context), None
+            return String(self.value * other.value), None
         else:
             return None, Value.illegal_operation(self, other)
 
@@ -285,10 +403,7 @@ class String(Value):
         return len(self.value) > 0
 
     def copy(self):
-        copy = String(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+        return self
 
     def __str__(self):
         return self.value
@@ -298,16 +413,96 @@ class String(Value):
 
 
 
+############################ BINARY OPERATIONS
+# Handlers for the binary operators, looked up once per BinaryOperatorNode
+# by binary_operation. Each takes the evaluated operands and returns
+# (result, error) like the Value methods. Two Numbers, or two Strings for +,
+# are handled directly. Anything else goes to the left operand's method,
+# which produces the same errors as before.
+
+def arithmetic_operation(method_name, function):
+    def operation(left, right):
+        if type(left) is Number and type(right) is Number:
+            return Number(function(left.value, right.value)), None
+        return getattr(left, method_name)(right)
+    return operation
+
+def comparison_operation(method_name, function):
+    def operation(left, right):
+        if type(left) is Number and type(right) is Number:
+            return (Number.true if function(left.value, right.value) else Number.false), None
+        return getattr(left, method_name)(right)
+    return operation
+
+def add(left, right):
+    left_type = type(left)
+    if left_type is type(right):
+        if left_type is Number:
+            return Number(left.value + right.value), None
+        if left_type is String:
+            return String(left.value + right.value), None
+    return left.added_to(right)
+
+def divide(left, right):
+    if type(left) is Number and type(right) is Number and right.value != 0:
+        return Number(left.value / right.value), None
+    return left.divided_by(right)
+
+BINARY_OPERATIONS = {
+    Constants.TOK_PLUS: add,
+    Constants.TOK_MINUS: arithmetic_operation('subtracted_by', operator.sub),
+    Constants.TOK_MULTIPLY: arithmetic_operation('multiplied_by', operator.mul),
+    Constants.TOK_DIVIDE: divide,
+    Constants.TOK_POW: arithmetic_operation('powered_by', operator.pow),
+    Constants.TOK_EE: comparison_operation('compare_equals', operator.eq),
+    Constants.TOK_NE: comparison_operation('compare_not_equals', operator.ne),
+    Constants.TOK_LT: comparison_operation('compare_lt', operator.lt),
+    Constants.TOK_GT: comparison_operation('compare_gt', operator.gt),
+    Constants.TOK_LTE: comparison_operation('compare_lte', operator.le),
+    Constants.TOK_GTE: comparison_operation('compare_gte', operator.ge),
+}
+
+KEYWORD_OPERATIONS = {
+    'and': arithmetic_operation('and_to', lambda a, b: int(a and b)),
+    'or': arithmetic_operation('or_to', lambda a, b: int(a or b)),
+}
+
+def binary_operation(operator_tok):
+    '''
+    The handler for operator_tok, or None if it is not a binary operator.
+    '''
+    if operator_tok.type == Constants.TOK_KEYWORD:
+        return KEYWORD_OPERATIONS.get(operator_tok.value)
+    return BINARY_OPERATIONS.get(operator_tok.type)
+
+def short_circuit(keyword, left):
+    '''
+    The value of `left and ...` or `left or ...`, for keyword 'and' or 'or',
+    if it is the same whatever the right operand is, in which case that is
+    not evaluated. Otherwise None. The value matches what and_to and or_to
+    return.
+    '''
+    if type(left) is Number:
+        if keyword == 'and' and not left.value:
+            return Number.false
+        if keyword == 'or' and left.value:
+            return Number(int(left.value))
+    return None
+
+
+
 
 
 class BaseFunction(Value):
+    layout = None
+
     def __init__(self, name):
         super().__init__()
         self.name = name or "<anonymous>"
 
     def generate_new_context(self):
         new_context = Context(self.name, self.context, self.pos_start)
-        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table, self.layout)
         return new_context
 
     def check_args(self, arg_names, args):
@@ -337,11 +532,10 @@ class BaseFunction(Value):
             exec_ctx.symbol_table.set(arg_name, arg_value)
 
     def check_and_populate_args(self, arg_names, args, exec_ctx):
-        res = RuntimeResult()
-        res.register(self.check_args(arg_names, args))
+        res = self.check_args(arg_names, args)
         if res.should_return(): return res
         self.populate_args(arg_names, args, exec_ctx)
-        return res.success(None)
+        return res
 
 
 
@@ -358,11 +552,15 @@ class BaseFunction(Value):
 
 
 class Function(BaseFunction):
-    def __init__(self, name, body_node, arg_names, should_auto_return):
+    def __init__(self, name, body_node, arg_names, should_auto_return, layout=None):
         super().__init__(name)
         self.body_node = body_node
         self.arg_names = arg_names
         self.should_auto_return = should_auto_return
+        self.layout = layout
+        self.arg_slots = [layout[arg_name] for arg_name in arg_names] if layout is not None else None
+        if layout:
+            SymbolTable.add_local_names(layout)
 
     def execute(self, args):
         res = RuntimeResult()
@@ -373,15 +571,23 @@ class Function(BaseFunction):
         if res.should_return():
             return res
 
-        value = res.register(interpreter.visit(self.body_node, exec_ctx))
-        if res.should_return() and res.func_return_value == None:
-            return res
-        
-        ret_value = (value if self.should_auto_return else None) or res.func_return_value or Number.null
-        return res.success(ret_value)
+        try:
+            value = interpreter.evaluate(self.body_node, exec_ctx)
+        except ReturnSignal as signal:
+            return res.success(signal.value)
+        except RuntimeFailure as failure:
+            return res.failure(failure.error)
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+
+        return res.success(value if self.should_auto_return else Number.null)
 
     def copy(self):
         copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return)
+        copy.layout = self.layout
+        copy.arg_slots = self.arg_slots
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
         return copy
@@ -394,26 +600,38 @@ class Function(BaseFunction):
 
 
 class BuiltInFunction(BaseFunction):
+    '''
+    A function implemented in Python. BUILTINS maps each name to the method
+    that implements it and the names of its arguments. execute checks the
+    number of arguments against those names and passes the arguments to
+    the method directly. The method returns (value, error) like the Value
+    operations.
+    '''
     def __init__(self, name):
         super().__init__(name)
 
     def execute(self, args):
         res = RuntimeResult()
-        exec_ctx = self.generate_new_context()
+        method, arg_names = BUILTINS[self.name]
 
-        method_name = f'execute_{self.name}'
-        method = getattr(self, method_name, self.no_visit_method)
+        if len(args) != len(arg_names):
+            return self.check_args(arg_names, args)
 
-        res.register(self.check_and_populate_args(method.arg_names, args, exec_ctx))
-        if res.should_return(): return res
+        value, error = method(self, *args)
+        if error:
+            return res.failure(error)
+        return res.success(value)
 
-        return_value = res.register(method(exec_ctx))
-        if res.should_return():
-            return res
-        return res.success(return_value)
-    
-    def no_visit_method(self, node, context):
-        raise Exception(f'No execute_{self.name} method defined')
+    def error(self, details):
+        '''
+        An RTError for a failure inside this function. Its Context is only
+        made here, so the traceback still shows the call.
+        '''
+        return RTError(
+            self.pos_start, self.pos_end,
+            details,
+            Context(self.name, self.context, self.pos_start)
+        )
 
     def copy(self):
         copy = BuiltInFunction(self.name)
@@ -428,21 +646,18 @@ class BuiltInFunction(BaseFunction):
 
     ############### Functions ##################
     
-    def execute_output(self, exec_ctx):
-        print(str(exec_ctx.symbol_table.get('value')))
-        return RuntimeResult().success(Number.null)
-    execute_output.arg_names = ['value']
+    def execute_output(self, value):
+        print(str(value))
+        return Number.null, None
     
-    def execute_echo(self, exec_ctx):
-        return RuntimeResult().success(String(str(exec_ctx.symbol_table.get('value'))))
-    execute_echo.arg_names = ['value']
+    def execute_echo(self, value):
+        return String(str(value)), None
     
-    def execute_getline(self, exec_ctx):
+    def execute_getline(self):
         text = input()
-        return RuntimeResult().success(String(text))
-    execute_getline.arg_names = []
+        return String(text), None
 
-    def execute_getnum(self, exec_ctx):
+    def execute_getnum(self):
         while True:
             text = input()
             try:
@@ -450,157 +665,108 @@ class BuiltInFunction(BaseFunction):
                 break
             except ValueError:
                 print(f"'{text}' must be an integer. Try again!")
-        return RuntimeResult().success(Number(number))
-    execute_getnum.arg_names = []
+        return Number(number), None
 
-    def execute_clear(self, exec_ctx):
+    def execute_clear(self):
         import os, platform
         os.system('cls' if platform.system() == 'Windows' else 'clear') 
-        return RuntimeResult().success(Number.null)
-    execute_clear.arg_names = []
+        return Number.null, None
     
     
-    def execute_isnum(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), Number)
-        return RuntimeResult().success(Number.true if is_number else Number.false)
-    execute_isnum.arg_names = ["value"]
-
-    def execute_isstr(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), String)
-        return RuntimeResult().success(Number.true if is_number else Number.false)
-    execute_isstr.arg_names = ["value"]
-
-    def execute_islist(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), LinkedList)
-        return RuntimeResult().success(Number.true if is_number else Number.false)
-    execute_islist.arg_names = ["value"]
-
-    def execute_isfunc(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), BaseFunction)
-        return RuntimeResult().success(Number.true if is_number else Number.false)
-    execute_isfunc.arg_names = ["value"]
+    def execute_isnum(self, value):
+        return (Number.true if isinstance(value, Number) else Number.false), None
 
-        
-    def execute_append(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
-        value = exec_ctx.symbol_table.get("value")
+    def execute_isstr(self, value):
+        return (Number.true if isinstance(value, String) else Number.false), None
+
+    def execute_islist(self, value):
+        return (Number.true if isinstance(value, LinkedList) else Number.false), None
 
+    def execute_isfunc(self, value):
+        return (Number.true if isinstance(value, BaseFunction) else Number.false), None
+
+        
+    def execute_append(self, list_, value):
         if not isinstance(list_, LinkedList):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "First argument must be list",
-                exec_ctx
-            ))
+            return None, self.error("First argument must be list")
 
         list_.elements.append(value)
-        return RuntimeResult().success(Number.null)
-    execute_append.arg_names = ["list", "value"]
-
-    def execute_pop(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
-        index = exec_ctx.symbol_table.get("index")
+        return Number.null, None
 
+    def execute_pop(self, list_, index):
         if not isinstance(list_, LinkedList):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "First argument must be list",
-                exec_ctx
-            ))
+            return None, self.error("First argument must be list")
 
         if not isinstance(index, Number):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "Second argument must be number",
-                exec_ctx
-            ))
+            return None, self.error("Second argument must be number")
 
         try:
             element = list_.elements.pop(index.value)
         except:
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                'Element at this index could not be removed from list because index is out of bounds',
-                exec_ctx
-            ))
-        return RuntimeResult().success(element)
-    execute_pop.arg_names = ["list", "index"]
-
-    def execute_extend(self, exec_ctx):
-        listA = exec_ctx.symbol_table.get("listA")
-        listB = exec_ctx.symbol_table.get("listB")
+            return None, self.error('Element at this index could not be removed from list because index is out of bounds')
+        return element, None
 
+    def execute_extend(self, listA, listB):
         if not isinstance(listA, LinkedList):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "First argument must be list",
-                exec_ctx
-            ))
+            return None, self.error("First argument must be list")
 
         if not isinstance(listB, LinkedList):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "Second argument must be list",
-                exec_ctx
-            ))
+            return None, self.error("Second argument must be list")
 
         listA.elements.extend(listB.elements)
-        return RuntimeResult().success(Number.null)
-    execute_extend.arg_names = ["listA", "listB"]
+        return Number.null, None
     
     
-    def execute_len(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
-
+    def execute_len(self, list_):
         if not isinstance(list_, LinkedList):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "Argument must be list",
-                exec_ctx
-            ))
+            return None, self.error("Argument must be list")
 
-        return RuntimeResult().success(Number(len(list_.elements)))
-    execute_len.arg_names = ["list"]
+        return Number(len(list_.elements)), None
     
     
     
-    def execute_run(self, exec_ctx):
+    def execute_run(self, fn):
         import main
-        fn = exec_ctx.symbol_table.get("fn")
 
         if not isinstance(fn, String):
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                "Second argument must be string",
-                exec_ctx
-            ))
+            return None, self.error("Second argument must be string")
 
         fn = fn.value
 
         try:
-            with open(fn, "r") as f:
-                script = f.read()
-        except Exception as e:
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
-                f"Failed to load script \"{fn}\"\n" + str(e),
-                exec_ctx
-            ))
+            key, node, error = main.load(fn)
+        except (OSError, ValueError) as e:
+            return None, self.error(f"Failed to load script \"{fn}\"\n" + str(e))
 
-        _, error = main.run(fn, script)
-        
+        if not error:
+            _, error = main.execute(key, node)
         if error:
-            return RuntimeResult().failure(RTError(
-                self.pos_start, self.pos_end,
+            return None, self.error(
                 f"Failed to finish executing script \"{fn}\"\n" +
-                error.as_string(),
-                exec_ctx
-            ))
+                error.as_string()
+            )
 
-        return RuntimeResult().success(Number.null)
-    execute_run.arg_names = ["fn"]
+        return Number.null, None
     
     
 
+BUILTINS = {
+    'output':  (BuiltInFunction.execute_output, ['value']),
+    'echo':    (BuiltInFunction.execute_echo, ['value']),
+    'getline': (BuiltInFunction.execute_getline, []),
+    'getnum':  (BuiltInFunction.execute_getnum, []),
+    'clear':   (BuiltInFunction.execute_clear, []),
+    'isnum':   (BuiltInFunction.execute_isnum, ['value']),
+    'isstr':   (BuiltInFunction.execute_isstr, ['value']),
+    'islist':  (BuiltInFunction.execute_islist, ['value']),
+    'isfunc':  (BuiltInFunction.execute_isfunc, ['value']),
+    'append':  (BuiltInFunction.execute_append, ['list', 'value']),
+    'pop':     (BuiltInFunction.execute_pop, ['list', 'index']),
+    'extend':  (BuiltInFunction.execute_extend, ['listA', 'listB']),
+    'length':  (BuiltInFunction.execute_len, ['list']),
+    'run':     (BuiltInFunction.execute_run, ['fn']),
+}
+
 BuiltInFunction.print       = BuiltInFunction("output")
 BuiltInFunction.print_ret   = BuiltInFunction("echo")
 BuiltInFunction.input       = BuiltInFunction("getline")
@@ -620,35 +786,45 @@ BuiltInFunction.length      = BuiltInFunction("length")
 
 
 class LinkedList(Value):
+    '''
+    elements is shared by every copy of a list, so append, pop and extend
+    change the list for each variable holding it. It is a ListElements, or
+    a LazyLoopElements for the result of a pure for loop. +, - and * leave
+    the list alone and return a new one, built from a new version of its
+    PersistentVector that shares most of its nodes.
+    '''
     def __init__(self, elements):
         super().__init__()
+        if isinstance(elements, list):
+            elements = ListElements(PersistentVector(elements))
         self.elements = elements
 
+    def derive(self, vector):
+        new_list = LinkedList(ListElements(vector))
+        new_list.set_pos(self.pos_start, self.pos_end)
+        new_list.set_context(self.context)
+        return new_list
+
     def added_to(self, other):
-        new_list = self.copy()
-        new_list.elements.append(other)
-        return new_list, None
+        return self.derive(self.elements.snapshot().append(other)), None
 
     def subtracted_by(self, other):
         if isinstance(other, Number):
-            new_list = self.copy()
             try:
-                new_list.elements.pop(other.value)
-                return new_list, None
+                return self.derive(self.elements.snapshot().remove(other.value)), None
             except:
                 return None, RTError(
                 other.pos_start, other.pos_end,
                 'Element at this index could not be removed from list because index is out of bounds',
-                self.context
+                self.context,
+                operand='right'
                 )
         else:
             return None, Value.illegal_operation(self, other)
 
     def multiplied_by(self, other):
         if isinstance(other, LinkedList):
-            new_list = self.copy()
-            new_list.elements.extend(other.elements)
-            return new_list, None
+            return self.derive(self.elements.snapshot().extend(other.elements)), None
         else:
             return None, Value.illegal_operation(self, other)
 
@@ -660,7 +836,8 @@ class LinkedList(Value):
                 return None, RTError(
                 other.pos_start, other.pos_end,
                 'Element at this index could not be retrieved from list because index is out of bounds',
-                self.context
+                self.context,
+                operand='right'
                 )
         else:
             return None, Value.illegal_operation(self, other)
@@ -681,14 +858,153 @@ class LinkedList(Value):
 
 
 
+class ListElements:
+    '''
+    The elements of a LinkedList. It holds a PersistentVector, and append,
+    pop and extend replace it with a new version, so every copy of the
+    LinkedList, which all share this object, sees the change. snapshot
+    returns the current vector for +, - and * to build on.
+    '''
+    __slots__ = ('vector',)
+
+    def __init__(self, vector):
+        self.vector = vector
+
+    def snapshot(self):
+        return self.vector
+
+    def __len__(self):
+        return len(self.vector)
+
+    def __getitem__(self, index):
+        return self.vector[index]
+
+    def __iter__(self):
+        return iter(self.vector)
 
+    def append(self, value):
+        self.vector = self.vector.append(value)
 
+    def pop(self, index=-1):
+        element = self.vector[index]
+        self.vector = self.vector.remove(index)
+        return element
+
+    def extend(self, values):
+        self.vector = self.vector.extend(values)
+
+
+
+
+class LazyLoopElements:
+    '''
+    Stands in for the ListElements of a for loop's LinkedList when the
+    body is a pure numeric expression of the loop variable. Elements are
+    computed from the loop counter when indexed or iterated, so printing
+    streams them and indexing computes just one. Anything that needs the
+    elements as a PersistentVector, like a change to the list, materialises
+    it first. Copies of the LinkedList share this object, just like they
+    share a ListElements.
+    '''
+    def __init__(self, counter, body_node, var_name, slot):
+        self.counter = counter
+        self.body_node = body_node
+        self.var_name = var_name
+        self.slot = slot
+        self.materialized = None
+        self.context = Context('<lazy loop>')
+        self.context.symbol_table = SymbolTable()
+        if slot is not None:
+            self.context.symbol_table.slots = [None] * (slot + 1)
+
+    def compute(self, i):
+        if self.slot is None:
+            self.context.symbol_table.set(self.var_name, Number(i))
+        else:
+            self.context.symbol_table.slots[self.slot] = Number(i)
+        return Interpreter().evaluate(self.body_node, self.context)
+
+    def materialize(self):
+        if self.materialized is None:
+            self.materialized = PersistentVector(self.compute(i) for i in self.counter)
+        return self.materialized
+
+    snapshot = materialize
+
+    def __len__(self):
+        if self.materialized is None:
+            return len(self.counter)
+        return len(self.materialized)
+
+    def __getitem__(self, index):
+        if self.materialized is None:
+            return self.compute(self.counter[index])
+        return self.materialized[index]
+
+    def __iter__(self):
+        if self.materialized is None:
+            return (self.compute(i) for i in self.counter)
+        return iter(self.materialized)
+
+    def append(self, value):
+        self.materialized = self.materialize().append(value)
+
+    def pop(self, index=-1):
+        element = self.materialize()[index]
+        self.materialized = self.materialized.remove(index)
+        return element
+
+    def extend(self, values):
+        self.materialized = self.materialize().extend(values)
+
+
+
+
+
+
+
+
+
+
+def float_range(i, end, step):
+    '''
+    The counter of a for loop whose bounds or step are not all integers.
+    Integer loops use range() instead.
+    '''
+    if step >= 0:
+        while i < end:
+            yield i
+            i += step
+    else:
+        while i > end:
+            yield i
+            i += step
 
 
 
 
 class Interpreter:
+    '''
+    visit is the entry point and reports the outcome as a RuntimeResult.
+    Internally every visit_ method returns its value directly; errors,
+    return, break and continue unwind as RuntimeFailure, ReturnSignal,
+    BreakSignal and ContinueSignal, so a node that succeeds allocates
+    nothing but its value.
+    '''
     def visit(self, node, context):
+        res = RuntimeResult()
+        try:
+            return res.success(self.evaluate(node, context))
+        except RuntimeFailure as failure:
+            return res.failure(failure.error)
+        except ReturnSignal as signal:
+            return res.success_return(signal.value)
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+
+    def evaluate(self, node, context):
         method_name = f'visit_{type(node).__name__}'
         method = getattr(self, method_name, self.no_visit_method)
         return method(node, context)
@@ -697,61 +1013,33 @@ class Interpreter:
         raise Exception(f'No visit_{type(node).__name__} method defined')
 
     def visit_NumberNode(self,node, context):
-        return RuntimeResult().success(Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end))
+        if node.constant is None:
+            node.constant = Number(node.tok.value)
+        return node.constant
     
     def visit_BinaryOperatorNode(self, node, context):
-        rtresult = RuntimeResult()
-
-        left= rtresult.register(self.visit(node.left_node, context))
-        right = rtresult.register(self.visit(node.right_node, context))
-
-        if rtresult.error:
-            return rtresult
+        left = self.evaluate(node.left_node, context)
+        if node.operator.type == Constants.TOK_KEYWORD:
+            result = short_circuit(node.operator.value, left)
+            if result is not None:
+                return result
+        right = self.evaluate(node.right_node, context)
 
-        if node.operator.type == Constants.TOK_PLUS:
-            result, error = left.added_to(right)
-
-        elif node.operator.type == Constants.TOK_MINUS:
-            result, error = left.subtracted_by(right)
-
-        elif node.operator.type == Constants.TOK_MULTIPLY:
-            result, error = left.multiplied_by(right)
-        
-        elif node.operator.type == Constants.TOK_DIVIDE:
-            result, error = left.divided_by(right)
-
-        elif node.operator.type == Constants.TOK_POW:
-            result, error = left.powered_by(right)
-        
-
-        # COMPARISIONS
-        elif node.operator.type == Constants.TOK_EE:
-            result, error = left.compare_equals(right)
-        elif node.operator.type == Constants.TOK_NE:
-            result, error = left.compare_not_equals(right)
-        elif node.operator.type == Constants.TOK_LT:
-            result, error = left.compare_lt(right)
-        elif node.operator.type == Constants.TOK_GT:
-            result, error = left.compare_gt(right)
-        elif node.operator.type == Constants.TOK_LTE:
-            result, error = left.compare_lte(right)
-        elif node.operator.type == Constants.TOK_GTE:
-            result, error = left.compare_gte(right)
-        elif node.operator.matches(Constants.TOK_KEYWORD, 'and'):
-            result, error = left.and_to(right)
-        elif node.operator.matches(Constants.TOK_KEYWORD, 'or'):
-            result, error = left.or_to(right)
-        
+        if node.operation is None:
+            node.operation = binary_operation(node.operator)
+        result, error = node.operation(left, right)
 
         if error:
-            return rtresult.failure(error)
-        else:
-            return rtresult.success(result.set_pos(node.pos_start, node.pos_end))
+            raise RuntimeFailure(error.locate(
+                (node.left_node.pos_start, node.left_node.pos_end),
+                (node.right_node.pos_start, node.right_node.pos_end),
+                context
+            ))
+        return result.set_pos(node.pos_start, node.pos_end)
 
 
     def visit_UnaryOperatorNode(self, node, context):
-        rtresult = RuntimeResult()
-        num = rtresult.register(self.visit(node.node, context))
+        num = self.evaluate(node.node, context)
 
         if node.operator.type == Constants.TOK_MINUS:
             num, error= num.multiplied_by(Number(-1))
@@ -759,195 +1047,209 @@ class Interpreter:
             num, error = num.notted()
             
         if error:
-            return rtresult.failure(error)
-        else:   
-            return rtresult.success(num.set_pos(node.pos_start, node.pos_end))
+            raise RuntimeFailure(error.locate((node.node.pos_start, node.node.pos_end), None, context))
+        return num.set_pos(node.pos_start, node.pos_end)
 
     def visit_VarAccessNode(self, node, context):
-        res = RuntimeResult()
         var_name = node.var_name_tok.value
-        value = context.symbol_table.get(var_name)
-
-        if not value:
+        symbol_table = context.symbol_table
+        if node.slot is not None:
+            value = symbol_table.get_slot(node.slot, var_name)
+        elif symbol_table.parent is None:
+            value = symbol_table.get(var_name)
+        else:
+            # Inside a function. A global or builtin is cached, see SymbolTable
+            root = symbol_table.root
+            cache = node.cache
+            if cache is not None and cache[0] is root and cache[1] == root.version and cache[2] == SymbolTable.local_names_version:
+                value = cache[3]
+            else:
+                value = symbol_table.get(var_name)
+                if value is not None and var_name not in SymbolTable.local_names:
+                    node.cache = (root, root.version, SymbolTable.local_names_version, value)
+
+        if value is None:
             details = f"\'{var_name}\' is not defined"
-            return res.failure(RTError(
+            raise RuntimeFailure(RTError(
                 node.pos_start, node.pos_end,
                 details,
                 context
             ))
-        value = value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
-        return res.success(value)
+        return value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
 
     def visit_VarAssignNode(self, node, context):
-        res = RuntimeResult()
-        var_name = node.var_name_tok.value
-
-        value = res.register(self.visit(node.value_node, context))
+        value = self.evaluate(node.value_node, context)
 
-        if res.should_return():
-            return res
-        context.symbol_table.set(var_name, value)
-        return res.success(value)
+        if node.slot is None:
+            context.symbol_table.set(node.var_name_tok.value, value)
+        else:
+            context.symbol_table.set_slot(node.slot, value)
+        return value
 
 
     def visit_IfNode(self, node, context):
-        res = RuntimeResult()
-
         for condition, expr, should_return_null in node.cases:
-            condition_value = res.register(self.visit(condition, context))
-            if res.should_return():
-                return res
+            condition_value = self.evaluate(condition, context)
             if condition_value.is_true():
-                expr_value = res.register(self.visit(expr, context))
-
-                if res.should_return():
-                    return res
-                return res.success(Number.null if should_return_null else expr_value)
+                expr_value = self.evaluate(expr, context)
+                return Number.null if should_return_null else expr_value
             
             
         if node.else_case:
             expr, should_return_null = node.else_case
-            expr_value = res.register(self.visit(expr, context))
-            if res.should_return():
-                return res
-            return res.success(Number.null if should_return_null else expr_value)
+            expr_value = self.evaluate(expr, context)
+            return Number.null if should_return_null else expr_value
 
-        return res.success(Number.null)
+        return Number.null
 
 
     def visit_ForNode(self, node, context):
-        res = RuntimeResult()
-        elements = []
-        start_value = res.register(self.visit(node.start_value_node, context))
-        if res.should_return():
-            return res
-
-        end_value = res.register(self.visit(node.end_value_node, context))
-        if res.should_return():
-            return res
+        start = self.evaluate(node.start_value_node, context).value
+        end = self.evaluate(node.end_value_node, context).value
 
         if node.step_value_node:
-            step_value = res.register(self.visit(node.step_value_node, context))
-            if res.should_return():
-                return res
+            step = self.evaluate(node.step_value_node, context).value
         else:
-            step_value = Number(1)
-
-        i = start_value.value
+            step = 1
 
-        if step_value.value>=0:
-            condition = lambda: i< end_value.value
+        if type(start) is int and type(end) is int and type(step) is int and step != 0:
+            counter = range(start, end, step)
         else:
-            condition = lambda: i> end_value.value
+            counter = float_range(start, end, step)
 
-        while condition():
-            context.symbol_table.set(node.var_name_tok.value, Number(i))
-            i+=step_value.value
-
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
-            
-            if res.loop_should_continue:
+        discard = node.should_return_null or node.is_statement
+        elements = []
+        symbol_table = context.symbol_table
+        var_name = node.var_name_tok.value
+        slot = node.slot
+        body_node = node.body_node
+        evaluate = self.evaluate
+
+        if node.has_pure_body and not discard and type(counter) is range:
+            if counter:
+                if slot is None:
+                    symbol_table.set(var_name, Number(counter[-1]))
+                else:
+                    symbol_table.slots[slot] = Number(counter[-1])
+            elements = LazyLoopElements(counter, body_node, var_name, slot)
+            return LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
+
+        for i in counter:
+            if slot is None:
+                symbol_table.set(var_name, Number(i))
+            else:
+                symbol_table.slots[slot] = Number(i)
+            try:
+                value = evaluate(body_node, context)
+            except ContinueSignal:
                 continue
-            
-            if res.loop_should_break:
+            except BreakSignal:
                 break
-            elements.append(value)
+            if not discard:
+                elements.append(value)
 
-        return res.success(Number.null if node.should_return_null else LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+        if discard:
+            return Number.null
+        return LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
 
     def visit_WhileNode(self, node, context):
-        res = RuntimeResult()
         elements= []
-        while True:
-            condition = res.register(self.visit(node.condition_node, context))
-            if res.should_return():
-                return res
-
-            if not condition.is_true():
-                break
-            value = res.register(self.visit(node.body_node, context))
-            
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
-            
-            if res.loop_should_continue:
+        while self.evaluate(node.condition_node, context).is_true():
+            try:
+                value = self.evaluate(node.body_node, context)
+            except ContinueSignal:
                 continue
-            
-            if res.loop_should_break:
+            except BreakSignal:
                 break
             elements.append(value)
     
-        return res.success(Number.null if node.should_return_null else LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+        return Number.null if node.should_return_null else LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
 
 
     def visit_FuncDefNode(self, node, context):
-        res = RuntimeResult()
-
         func_name = node.var_name_tok.value if node.var_name_tok else None
         body_node = node.body_node
         arg_names= [arg_name.value for arg_name in node.arg_name_toks]
-        func_value = Function(func_name, body_node, arg_names, node.should_auto_return).set_context(context).set_pos(node.pos_start, node.pos_end)
+        func_value = Function(func_name, body_node, arg_names, node.should_auto_return, node.layout).set_context(context).set_pos(node.pos_start, node.pos_end)
 
-        if node.var_name_tok:
+        if node.slot is not None:
+            context.symbol_table.set_slot(node.slot, func_value)
+        elif node.var_name_tok:
             context.symbol_table.set(func_name, func_value)
-        return res.success(func_value)
+        return func_value
 
     def visit_CallNode(self, node, context):
-        res= RuntimeResult()
+        value_to_call = self.evaluate(node.node_to_call, context)
+        args = [self.evaluate(arg_node, context) for arg_node in node.arg_nodes]
 
-        args= []
+        if type(value_to_call) is Function and value_to_call.arg_slots is not None:
+            if node.checked_arg_names is value_to_call.arg_names:
+                return self.call_function(value_to_call, args, node, context)
+            if len(args) == len(value_to_call.arg_names):
+                node.checked_arg_names = value_to_call.arg_names
+                return self.call_function(value_to_call, args, node, context)
 
-        value_to_call = res.register(self.visit(node.node_to_call,context))
-        if res.should_return():
-            return res
-        
         value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
-
-        for arg_node in node.arg_nodes:
-            args.append(res.register(self.visit(arg_node, context)))
-            if res.should_return():
-                return res
-        
-        return_value = res.register(value_to_call.execute(args))
-        if res.should_return():
-            return res
-        
-        return_value = return_value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
-        return res.success(return_value)
+        res = value_to_call.execute(args)
+        if res.error:
+            raise RuntimeFailure(res.error)
+        if res.loop_should_break:
+            raise BreakSignal()
+        if res.loop_should_continue:
+            raise ContinueSignal()
+
+        return res.value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
     
+    def call_function(self, func, args, node, context):
+        '''
+        Calls a Function whose arity this call site has already checked.
+        Does the same as Function.execute, but runs the body on this
+        Interpreter, writes the arguments straight into the frame's slots,
+        and lets signals propagate instead of converting them to a
+        RuntimeResult and back.
+        '''
+        exec_ctx = Context(func.name, func.context, node.pos_start)
+        exec_ctx.symbol_table = symbol_table = SymbolTable(func.context.symbol_table, func.layout)
+        slots = symbol_table.slots
+        for slot, arg_value in zip(func.arg_slots, args):
+            slots[slot] = arg_value.set_context(exec_ctx)
+
+        try:
+            value = self.evaluate(func.body_node, exec_ctx)
+        except ReturnSignal as signal:
+            value = signal.value
+        else:
+            if not func.should_auto_return:
+                value = Number.null
+
+        return value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
+
     def visit_StringNode(self, node, context):
-        return RuntimeResult().success(
-            String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        if node.constant is None:
+            node.constant = String(node.tok.value)
+        return node.constant
     
     
     def visit_ListNode(self, node, context):
-        res = RuntimeResult()
-        elements = []
+        if node.is_statement:
+            for element_node in node.element_nodes:
+                self.evaluate(element_node, context)
+            return Number.null
 
-        for element_node in node.element_nodes:
-            elements.append(res.register(self.visit(element_node, context)))
-            if res.should_return(): return res
+        elements = [self.evaluate(element_node, context) for element_node in node.element_nodes]
 
-        return res.success(
-            LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        return LinkedList(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
         
     def visit_ReturnNode(self, node, context):
-        res = RuntimeResult()
         if node.node_to_return:
-            value = res.register(self.visit(node.node_to_return, context))
-            if res.should_return():
-                return res
+            value = self.evaluate(node.node_to_return, context)
         else:
             value = Number.null
         
-        return res.success_return(value)
+        raise ReturnSignal(value)
     
     def visit_ContinueNode(self, node, context):
-        return RuntimeResult().success_continue()
+        raise ContinueSignal()
 
     def visit_BreakNode(self, node, context):
-        return RuntimeResult().success_break()
\ No newline at end of file
+        raise BreakSignal()
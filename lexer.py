@@ -1,17 +1,35 @@
+import os
+import re
+import mmap
+from bisect import bisect_right
+
 from errors import Error, IllegalCharError, ExpectedCharError
 from constants import Constants
 
 class Token:
-    def __init__(self, type_, value=None, pos_start=None, pos_end=None):
+    '''
+    Tokens only keep their start and end offsets into source and build
+    Positions on demand. An end of None stands for source.end_pos, the end
+    of the text.
+    '''
+    __slots__ = ('type', 'value', 'start', 'end', 'source')
+
+    def __init__(self, type_, value, start, end, source):
         self.type=type_
         self.value=value
+        self.start = start
+        self.end = end
+        self.source = source
+
+    @property
+    def pos_start(self):
+        return Position(self.start, self.source)
 
-        if pos_start:
-            self.pos_start=pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance()
-        if pos_end:
-            self.pos_end=  pos_end
+    @property
+    def pos_end(self):
+        if self.end is None:
+            return self.source.end_pos
+        return Position(self.end, self.source, 1)
 
     def matches(self, type_, value):
         return self.type==type_ and self.value==value 
@@ -24,235 +42,321 @@ class Token:
 
 
 
-class Position:
-    def __init__(self, idx, ln, col,fname, ftext):
-        self.idx = idx
-        self.ln = ln
-        self.col = col
-        self.fname = fname
-        self.ftext = ftext
+class Source:
+    '''
+    A file being lexed. Text read from a stream is kept as a list of chunks
+    until something needs it in one piece. The offsets where its lines start
+    are only worked out the first time a Position needs its line or column,
+    which is usually when an error is formatted.
 
-    def advance(self, current_char=None):
-        self.idx += 1
-        self.col += 1
-        if current_char == '\n':
-            self.ln += 1
-            self.col = 0
-        return self
-    
-    def copy(self):
-        return Position (self.idx, self.ln, self.col, self.fname, self.ftext)
+    Chunks are never dropped, even once their statements have run. A
+    function defined in them can still be called, and an error inside it
+    shows the line it is on, found by counting lines from the start of the
+    text. So the text costs about as much memory as the stream it was read
+    from, while the tokens and ASTs of statements that have run are freed.
 
+    buffer is set instead for an ASCII file mapped by load_source. It is
+    only decoded when an error needs the text. The map only lives until the
+    file has been lexed, see close().
 
+    end_pos is shared by every token that ends at the end of the text, and
+    follows the lexer until the text runs out.
+    '''
+    __slots__ = ('fname', 'chunks', 'buffer', 'end_pos', 'line_starts', 'indexed')
 
-class Lexer:
     def __init__(self, fname, text):
-        self.fname= fname
-        self.text=text
-        self.pos=Position(-1,0,-1,fname, text)
-        self.current_char=None
-        self.advance()
-    
-    ### GO FORWARD ###
-    def advance(self):
-        self.pos.advance(self.current_char)
-        self.current_char=self.text[self.pos.idx] if self.pos.idx<len(self.text) else None
-
-
-    def gen_tokens(self):
-        tokens=[]
-
-        while self.current_char!=None:
-            if self.current_char in ' \t':
-                self.advance()
-
-            elif self.current_char in Constants.LETTERS:
-                tokens.append(self.gen_identifier())
-            
-            elif self.current_char in ';\n':
-                tokens.append(Token(Constants.TOK_NEWLINE, pos_start = self.pos))
-                self.advance()
-
-            elif self.current_char in Constants.DIGITS:
-                tokens.append(self.gen_number())
-
-            elif self.current_char == '"':
-                tokens.append(self.gen_string())
-            
-            elif self.current_char == '#':
-                self.skip()
-            
-            
-            elif self.current_char == '+':
-                tokens.append(Token(Constants.TOK_PLUS, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '-':
-                tokens.append(self.gen_minus_or_arrow())
-            elif self.current_char == '*':
-                tokens.append(Token(Constants.TOK_MULTIPLY, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '/':
-                tokens.append(Token(Constants.TOK_DIVIDE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '^':
-                tokens.append(Token(Constants.TOK_POW, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '!':
-                tok, error = self.gen_not_equals()
-                if error:
-                    return [], error
-                tokens.append(tok)
-            elif self.current_char == '=':
-                tokens.append(self.gen_equals())
-            elif self.current_char == '<':
-                tokens.append(self.gen_less_than())
-            elif self.current_char == '>':
-                tokens.append(self.gen_greater_than())
-                
-            elif self.current_char == '(':
-                tokens.append(Token(Constants.TOK_LPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ')':
-                tokens.append(Token(Constants.TOK_RPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '[':
-                tokens.append(Token(Constants.TOK_LSQUARE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ']':
-                tokens.append(Token(Constants.TOK_RSQUARE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ',':
-                tokens.append(Token(Constants.TOK_COMMA, pos_start=self.pos))
-                self.advance()
-            
-
-
-            else:
-                pos_start = self.pos.copy()
-                char = self.current_char
-                self.advance()
-                return [], IllegalCharError(pos_start, self.pos,'\''+char+'\'')
-        tokens.append(Token(Constants.TOK_EOF, pos_start=self.pos))
-        return tokens, None
-
-
-    def skip(self):
-        self.advance()
-        while self.current_char != '\n':
-            self.advance()
-        self.advance()
-
+        self.fname = fname
+        if isinstance(text, str):
+            self.chunks = [text]
+            self.buffer = None
+        else:
+            self.chunks = None
+            self.buffer = text
+        self.end_pos = Position(0, self)
+        self.line_starts = [0]
+        self.indexed = 0
+
+    @property
+    def text(self):
+        if self.buffer is not None:
+            return self.buffer[:].decode('ascii')
+        if len(self.chunks) > 1:
+            self.chunks = [''.join(self.chunks)]
+        return self.chunks[0]
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+
+    def close(self):
+        '''
+        Replaces a memory map in buffer with a bytes copy of it and closes
+        the map. Tokens and ASTs keep their Source for as long as they live,
+        and a map kept open that long would hold the file open and crash the
+        process with SIGBUS if the file were truncated meanwhile.
+        '''
+        if isinstance(self.buffer, mmap.mmap):
+            buffer = self.buffer
+            self.buffer = buffer[:]
+            buffer.close()
+
+    def line_col(self, idx):
+        if self.buffer is not None:
+            text, newline = self.buffer, NEWLINE_BYTES_REGEX
+        else:
+            text, newline = self.text, NEWLINE_REGEX
+        if self.indexed < len(text):
+            self.line_starts += [match.end() for match in newline.finditer(text, self.indexed)]
+            self.indexed = len(text)
+        ln = bisect_right(self.line_starts, idx) - 1
+        return ln, idx - self.line_starts[ln]
 
-        
-    def gen_number(self):
-        num_str = ''
-        dot_count=0
-        pos_start = self.pos.copy()
 
-        while self.current_char != None and self.current_char in Constants.DIGITS + '.':
-            if self.current_char == '.':
-                if dot_count==1:
-                    break
-                dot_count+=1
-                num_str+='.'
-            else:
-                num_str+=self.current_char
-            self.advance()
-            
-        if dot_count==0:
-            return Token(Constants.TOK_INT, int(num_str), pos_start=pos_start, pos_end= self.pos)
-        else:
-            return Token(Constants.TOK_FLOAT, float(num_str), pos_start=pos_start, pos_end= self.pos)
 
+class Position:
+    '''
+    An offset into a Source. Positions that were advanced past a character
+    without looking at it, like the end of a one character token, keep the
+    line of the character they started on; shift counts those steps.
+    '''
+    __slots__ = ('idx', 'source', 'shift')
+
+    def __init__(self, idx, source, shift=0):
+        self.idx = idx
+        self.source = source
+        self.shift = shift
 
-    def gen_identifier(self):
-        id_str=''
-        pos_start=self.pos.copy()
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx - self.shift)[0]
 
-        LETTERS_DIGITS=Constants.LETTERS+Constants.DIGITS
+    @property
+    def col(self):
+        return self.source.line_col(self.idx - self.shift)[1] + self.shift
 
-        while self.current_char!=None and self.current_char in LETTERS_DIGITS +'_':
-            id_str+= self.current_char
-            self.advance()
-        
-        tok_type = Constants.TOK_KEYWORD if id_str in Constants.LIST_KEYWORDS else Constants.TOK_IDENTIFIER
-        return Token(tok_type, id_str, pos_start, self.pos)
+    @property
+    def fname(self):
+        return self.source.fname
 
+    @property
+    def ftext(self):
+        return self.source.text
 
+    def advance(self, current_char=None):
+        self.idx += 1
+        self.shift = 0 if current_char == '\n' else self.shift + 1
+        return self
+    
+    def copy(self):
+        return Position(self.idx, self.source, self.shift)
+
+
+
+TOKEN_REGEX = re.compile(r'''
+  [ \t]*
+  (?:
+    (?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)
+  | (?P<NEWLINE>[;\n])
+  | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)
+  | (?P<STRING>"[^"]*"?)
+  | (?P<COMMENT>\#[^\n]*\n?)
+  | (?P<MINUS>->?)
+  | (?P<NOT_EQUALS>!=?)
+  | (?P<EQUALS>==?)
+  | (?P<LESS_THAN><=?)
+  | (?P<GREATER_THAN>>=?)
+  | (?P<SINGLE>[+*/^()\[\],])
+  | (?P<END>\Z)
+  )
+''', re.VERBOSE)
+
+SPACE_REGEX = re.compile(r'[ \t]*')
+NEWLINE_REGEX = re.compile('\n')
+
+BYTES_TOKEN_REGEX = re.compile(TOKEN_REGEX.pattern.encode(), re.VERBOSE)
+BYTES_SPACE_REGEX = re.compile(SPACE_REGEX.pattern.encode())
+NEWLINE_BYTES_REGEX = re.compile(b'\n')
+NON_ASCII_BYTES_REGEX = re.compile(b'[\x80-\xff]')
+
+MMAP_MIN_SIZE = 1 << 20
+
+SINGLE_CHAR_TOKENS = {
+    '+': Constants.TOK_PLUS,
+    '*': Constants.TOK_MULTIPLY,
+    '/': Constants.TOK_DIVIDE,
+    '^': Constants.TOK_POW,
+    '(': Constants.TOK_LPAREN,
+    ')': Constants.TOK_RPAREN,
+    '[': Constants.TOK_LSQUARE,
+    ']': Constants.TOK_RSQUARE,
+    ',': Constants.TOK_COMMA,
+}
+
+COMPARISON_TOKENS = {
+    '=': Constants.TOK_EQUALS,
+    '==': Constants.TOK_EE,
+    '<': Constants.TOK_LT,
+    '<=': Constants.TOK_GTE,
+    '>': Constants.TOK_GT,
+    '>=': Constants.TOK_GTE,
+}
+
+KEYWORDS = set(Constants.LIST_KEYWORDS)
 
-    def gen_not_equals(self):
-        pos_start=self.pos.copy()
-        self.advance()
 
-        if self.current_char == '=':
-            self.advance()
-            return Token(Constants.TOK_EQUALS, pos_start=pos_start, pos_end=self.pos), None
-        
-        self.advance()
-        return None, ExpectedCharError(pos_start, self.pos,'Expected \'=\' after \'!\'')
 
-    def gen_equals(self):
-        tok_type = Constants.TOK_EQUALS
 
-        pos_start = self.pos.copy()
-        self.advance()
+class Lexer:
+    '''
+    Splits the text with TOKEN_REGEX and slices each token straight out of
+    it. Tokens only record offsets, see Token and Source.
+
+    chunks, if given, is an iterable of further text, like a file being read
+    line by line. iter_tokens only reads the next chunk when the token it
+    is looking at could run on into it, so tokens come out while the rest of
+    the file is still unread.
+
+    Identifiers, numbers, strings, '-', '->' and '!=' tokens all end at
+    source.end_pos, the end of the text. That matches the character by
+    character lexer this replaced.
+    '''
+    def __init__(self, fname, text, chunks=None):
+        self.source = Source(fname, text)
+        self.chunks = iter(chunks) if chunks is not None else None
+        self.error = None
 
-        if self.current_char == '=':
-            self.advance()
-            tok_type = Constants.TOK_EE
+    def gen_tokens(self):
+        tokens = list(self.iter_tokens())
+        self.source.close()
+        if self.error:
+            return [], self.error
+        return tokens, None
 
-        return Token(tok_type, pos_start, self.pos)
+    def read_chunk(self):
+        '''
+        Returns the next chunk of text, or '' once chunks is exhausted. An
+        empty chunk does not end the input, only the end of chunks does.
+        '''
+        if self.chunks is None:
+            return ''
+        for chunk in self.chunks:
+            if chunk:
+                self.source.append(chunk)
+                return chunk
+        self.chunks = None
+        return ''
+
+    def iter_tokens(self):
+        '''
+        Yields the tokens one at a time, ending with TOK_EOF. On an illegal
+        character it sets self.error and ends there with a TOK_EOF, so a
+        parser reading the tokens stops too. Whatever reads them has to
+        check self.error once it is done.
+        '''
+        source = self.source
+        if source.buffer is not None:
+            text, token_regex, space_regex = source.buffer, BYTES_TOKEN_REGEX, BYTES_SPACE_REGEX
+        else:
+            text, token_regex, space_regex = source.text, TOKEN_REGEX, SPACE_REGEX
+        # text is the part of the source from offset base on that has not
+        # been tokenised yet, plus whatever has been read after it
+        base = 0
+        idx = 0
+
+        while True:
+            match = token_regex.match(text, idx)
+            if match is None or (match.end() == len(text) and match.lastgroup not in ('NEWLINE', 'SINGLE')):
+                chunk = self.read_chunk()
+                if chunk:
+                    text, base, idx = text[idx:] + chunk, base + idx, 0
+                    continue
+
+            if match is None:
+                idx = space_regex.match(text, idx).end()
+                char = text[idx] if source.buffer is None else chr(text[idx])
+                self.error = IllegalCharError(Position(base + idx, source), Position(base + idx + 1, source), '\''+char+'\'')
+                break
+
+            kind = match.lastgroup
+            if kind == 'END':
+                # idx is already past the end after an unterminated string
+                idx = max(idx, match.end())
+                break
+
+            idx = match.start(kind)
+            next_idx = match.end()
+            start = base + idx
+
+            if kind == 'COMMENT':
+                idx = next_idx
+                continue
+
+            value = match.group(kind)
+            if source.buffer is not None:
+                value = value.decode('ascii')
+
+            if kind == 'IDENTIFIER':
+                tok_type = Constants.TOK_KEYWORD if value in KEYWORDS else Constants.TOK_IDENTIFIER
+                token = Token(tok_type, value, start, None, source)
+
+            elif kind == 'SINGLE':
+                token = Token(SINGLE_CHAR_TOKENS[value], None, start, start + 1, source)
+
+            elif kind == 'NEWLINE':
+                token = Token(Constants.TOK_NEWLINE, None, start, start + 1, source)
+
+            elif kind == 'NUMBER':
+                if '.' in value:
+                    token = Token(Constants.TOK_FLOAT, float(value), start, None, source)
+                else:
+                    token = Token(Constants.TOK_INT, int(value), start, None, source)
 
-    def gen_less_than(self):
-        tok_type = Constants.TOK_LT
+            elif kind == 'STRING':
+                if len(value) > 1 and value[-1] == '"':
+                    string = value[1:-1]
+                else:
+                    # An unterminated string also steps past the end of the text
+                    string = value[1:]
+                    next_idx += 1
+                token = Token(Constants.TOK_STRING, string.replace('\\', ''), start, None, source)
+
+            elif kind == 'MINUS':
+                tok_type = Constants.TOK_ARROW if value == '->' else Constants.TOK_MINUS
+                token = Token(tok_type, None, start, None, source)
+
+            elif kind == 'NOT_EQUALS':
+                if value == '!':
+                    self.error = ExpectedCharError(Position(start, source), Position(start + 2, source), 'Expected \'=\' after \'!\'')
+                    break
+                token = Token(Constants.TOK_EQUALS, None, start, None, source)
 
-        pos_start = self.pos.copy()
-        self.advance()
+            else:
+                token = Token(COMPARISON_TOKENS[value], Position(start, source), base + next_idx, base + next_idx + 1, source)
 
-        if self.current_char == '=':
-            self.advance()
-            tok_type = Constants.TOK_GTE
+            idx = next_idx
+            source.end_pos.idx = base + idx
+            yield token
 
-        return Token(tok_type, pos_start, self.pos)
+        source.end_pos.idx = base + idx
+        yield Token(Constants.TOK_EOF, None, base + idx, base + idx + 1, source)
 
-    def gen_greater_than(self):
-        tok_type = Constants.TOK_GT
 
-        pos_start = self.pos.copy()
-        self.advance()
 
-        if self.current_char == '=':
-            self.advance()
-            tok_type = Constants.TOK_GTE
 
-        return Token(tok_type, pos_start, self.pos)
+def load_source(fname):
+    '''
+    Returns the text of the file fname for Lexer. A large ASCII file is
+    returned as a read only memory map, which the lexer reads from directly,
+    so its text is never decoded. Lexer.gen_tokens copies it out and closes
+    the map once it is done, so the map must not be used after that.
+    Anything else is read as a str.
+    '''
+    with open(fname, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_SIZE:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if NON_ASCII_BYTES_REGEX.search(buffer) is None:
+                return buffer
+            buffer.close()
 
-    def gen_minus_or_arrow(self):
-        tok_type = Constants.TOK_MINUS
-        pos_start = self.pos.copy()
-        self.advance()
-        if self.current_char == '>':
-            self.advance()
-            tok_type= Constants.TOK_ARROW
-        return Token(tok_type, pos_start = pos_start, pos_end= self.pos)
-    
-    
-    def gen_string(self):
-        string = ''
-        pos_start = self.pos.copy()
-        escape_character = False
-        self.advance()
-
-        while self.current_char != None and (self.current_char != '"' or escape_character):
-            if escape_character:
-                string += Constants.ESCAPE_CHARACTERS.get(self.current_char, self.current_char)
-            else:
-                if self.current_char == '\\':
-                    escape_character = True
-                else:
-                    string += self.current_char
-            self.advance()
-            escape_character = False
-        
-        self.advance()
-        return Token(Constants.TOK_STRING, string, pos_start, self.pos)
\ No newline at end of file
+    with open(fname, 'r') as f:
+        return f.read()
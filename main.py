@@ -1,7 +1,17 @@
-from lexer import Lexer
+import sys
+import time
+
+from lexer import Lexer, Source, load_source
 from parser import Parser
+from resolver import Resolver
+from optimizer import ConstantFolder
 from interpreter import Context, Interpreter, SymbolTable, Number
 from interpreter import BuiltInFunction
+from compiler import Compiler, CompileError
+from vm import VM
+from closure_compiler import ClosureCompiler, run_closure
+from transpiler import transpile_program
+import hashcache
 
 global_symbol_table = SymbolTable()
 global_symbol_table.set('null', Number.null)
@@ -32,7 +42,26 @@ global_symbol_table.set('length', BuiltInFunction.length)
 
 
 
-def run(fname, text):
+parse_cache = hashcache.ParseCache()
+
+
+def parse(fname, text, fold_constants=True):
+    '''
+    Lexes, parses and resolves text, first folding its constants with a
+    ConstantFolder if fold_constants is set. If fname is a file, the result
+    is cached in hashcache and later runs of the same text load it from
+    there.
+    '''
+    path = hashcache.cache_path(fname, fold_constants)
+    if path:
+        digest = hashcache.source_digest(text)
+        source = Source(fname, text)
+        node = hashcache.load(path, digest, source)
+        if node:
+            source.close()
+            return node, None
+
+    start = time.perf_counter()
     lexer = Lexer(fname, text)
     tokens, errors = lexer.gen_tokens() 
 
@@ -43,16 +72,159 @@ def run(fname, text):
     ast = parser.parse()
     if ast.error:
         return None, ast.error
+    node = ast.node
+    if fold_constants:
+        node = ConstantFolder().fold(node)
+    Resolver().resolve(node)
+
+    if path:
+        hashcache.store(path, digest, node, time.perf_counter() - start)
+    return node, None
+
+
+def load(fname, text=None, fold_constants=True):
+    '''
+    Returns (key, node, error) for text, or the file fname if text is None.
+    Parsed programs are kept in parse_cache under key, so loading the same
+    text again in this process skips parsing, and an unchanged file is not
+    even read again. Reading the file can raise OSError, or ValueError if
+    it cannot be decoded.
+
+    fold_constants turns the ConstantFolder pass on or off.
+    '''
+    if text is None:
+        key = (hashcache.file_key(fname), fold_constants)
+        node = parse_cache.get(key)
+        if node is None:
+            text = load_source(fname)
+    else:
+        key = (hashcache.text_key(fname, text), fold_constants)
+        node = parse_cache.get(key)
+
+    if node is None:
+        node, error = parse(fname, text, fold_constants)
+        if error:
+            return key, None, error
+        parse_cache.set(key, node)
+    return key, node, None
+
+
+def execute(key, node, backend='interpreter'):
+    '''
+    Runs node, a program returned by load() under key.
+
+    backend selects how the parsed program is executed:
+        'interpreter' - walk the AST with the Interpreter
+        'vm'          - compile to bytecode and run it on the VM, falling
+                        back to the Interpreter for unsupported programs
+        'closure'     - turn the AST into pre-bound Python closures, with the
+                        same Interpreter fallback
+        'python'      - transpile to Python source and let CPython run it,
+                        with the same Interpreter fallback
+    '''
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+
+    if backend == 'vm':
+        try:
+            code = Compiler().compile(node)
+        except CompileError:
+            code = None
+        if code:
+            result = VM().run(code, context)
+            return result.value, result.error
+
+    if backend == 'closure':
+        try:
+            program = ClosureCompiler().compile(node)
+        except CompileError:
+            program = None
+        if program:
+            result = run_closure(program, context)
+            return result.value, result.error
+
+    if backend == 'python':
+        try:
+            program = transpile_program(key, node)
+        except CompileError:
+            program = None
+        if program:
+            result = program.run(context)
+            return result.value, result.error
 
     interpreter = Interpreter()
+    result = interpreter.visit(node, context)
+
+    return result.value, result.error
+
+
+def run(fname, text=None, backend='interpreter', fold_constants=True):
+    '''
+    Loads text, or the file fname if text is None, and executes it with
+    backend. See load() and execute().
+    '''
+    key, node, error = load(fname, text, fold_constants)
+    if error:
+        return None, error
+    return execute(key, node, backend)
+
+
+def run_stream(fname, chunks):
+    '''
+    Runs a program read piece by piece from chunks, like a file object or
+    sys.stdin, with the Interpreter. Each top level statement runs as soon
+    as it has been parsed, so only the statement being parsed is held as
+    tokens and the program starts before it has all been read. Unlike
+    run(), statements before a syntax error have already run when it is
+    reported, and the value returned is that of the last statement rather
+    than a list of all of them, which would grow with the stream.
+    '''
+    lexer = Lexer(fname, '', chunks)
+    parser = Parser(lexer.iter_tokens())
+
     context = Context('<program>')
     context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, context)
+    interpreter = Interpreter()
+    value = Number.null
 
-    return result.value, result.error
+    for statement in parser.iter_statements():
+        if lexer.error:
+            return None, lexer.error
+        if statement.error:
+            return None, statement.error
+        node = ConstantFolder().fold(statement.node)
+        Resolver().resolve(node)
+
+        result = interpreter.visit(node, context)
+        if result.should_return():
+            return result.value, result.error
+        value = result.value
+
+    if lexer.error:
+        return None, lexer.error
+    return value, None
 
 
 def main():
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+        try:
+            key, node, error = load(fname)
+        except (OSError, ValueError) as e:
+            print(f'Failed to load script "{fname}": {e}')
+            return
+        if not error:
+            result, error = execute(key, node)
+        if error:
+            print(error.as_string())
+        return
+
+    if not sys.stdin.isatty():
+        result, error = run_stream('<stdin>', sys.stdin)
+        if error:
+            print(error.as_string())
+        return
+
     while True:
         text = input('hash/> ')
         if text.strip() == '':
@@ -0,0 +1,198 @@
+import math
+
+from constants import Constants
+from lexer import Token
+from parser import NumberNode, StringNode, BinaryOperatorNode, UnaryOperatorNode
+from interpreter import Number, String, short_circuit
+
+
+FOLDED_OPERATORS = {
+    Constants.TOK_PLUS: 'added_to',
+    Constants.TOK_MINUS: 'subtracted_by',
+    Constants.TOK_MULTIPLY: 'multiplied_by',
+    Constants.TOK_DIVIDE: 'divided_by',
+    Constants.TOK_POW: 'powered_by',
+    Constants.TOK_EE: 'compare_equals',
+    Constants.TOK_NE: 'compare_not_equals',
+    Constants.TOK_LT: 'compare_lt',
+    Constants.TOK_GT: 'compare_gt',
+    Constants.TOK_LTE: 'compare_lte',
+    Constants.TOK_GTE: 'compare_gte',
+}
+
+NUMBER_OPERATORS = (
+    Constants.TOK_EE, Constants.TOK_NE, Constants.TOK_LT,
+    Constants.TOK_GT, Constants.TOK_LTE, Constants.TOK_GTE,
+)
+
+# Integer powers are only folded while the result stays about this small,
+# so a line like 9 ^ 9 ^ 9 that never runs cannot hang the parse.
+MAX_FOLDED_POWER_BITS = 4096
+
+
+class ConstantFolder:
+    '''
+    Replaces operators whose operands are number or string literals with the
+    literal they evaluate to, so 2 * 3 + 4 in a loop body is worked out once
+    instead of on every pass. The values come from the same Number and String
+    methods the interpreter calls, and an operation that fails, like a
+    division by zero or subtracting strings, is left in place so it still
+    raises its error when it runs. `and` and `or` are folded whenever the
+    left operand decides them, since the right one would not run.
+
+    Chains of unary minuses are shortened too: - - - x becomes - x, and
+    - - x becomes x when x is known to evaluate to a Number.
+    '''
+    def fold(self, node):
+        method = getattr(self, f'fold_{type(node).__name__}', None)
+        if method is None:
+            return node
+        return method(node)
+
+    def fold_BinaryOperatorNode(self, node):
+        node.left_node = self.fold(node.left_node)
+        node.right_node = self.fold(node.right_node)
+        operator = node.operator
+        left = self.constant(node.left_node)
+        if left is not None and operator.type == Constants.TOK_KEYWORD:
+            result = short_circuit(operator.value, left)
+            if result is not None:
+                return self.literal(result, node)
+
+        right = self.constant(node.right_node)
+        if left is None or right is None:
+            return node
+
+        if operator.matches(Constants.TOK_KEYWORD, 'and'):
+            method_name = 'and_to'
+        elif operator.matches(Constants.TOK_KEYWORD, 'or'):
+            method_name = 'or_to'
+        else:
+            method_name = FOLDED_OPERATORS.get(operator.type)
+        if method_name is None:
+            return node
+
+        if method_name == 'powered_by' and not self.is_small_power(left, right):
+            return node
+        try:
+            result, error = getattr(left, method_name)(right)
+        except ArithmeticError:
+            # Like 0 ^ -1, which fails in Python rather than with an RTError
+            return node
+        if error:
+            return node
+        return self.literal(result, node)
+
+    def fold_UnaryOperatorNode(self, node):
+        node.node = self.fold(node.node)
+        if node.operator.type != Constants.TOK_MINUS:
+            return node
+
+        operand = node.node
+        value = self.constant(operand)
+        if isinstance(value, Number):
+            result, error = value.multiplied_by(Number(-1))
+            return self.literal(result, node)
+
+        if isinstance(operand, UnaryOperatorNode) and operand.operator.type == Constants.TOK_MINUS:
+            inner = operand.node
+            if self.is_number(inner) or (
+                isinstance(inner, UnaryOperatorNode) and inner.operator.type == Constants.TOK_MINUS
+            ):
+                # An error in an enclosing operator still points at the
+                # whole chain
+                inner.pos_start = node.pos_start
+                inner.pos_end = node.pos_end
+                return inner
+        return node
+
+    def fold_VarAssignNode(self, node):
+        node.value_node = self.fold(node.value_node)
+        return node
+
+    def fold_ListNode(self, node):
+        node.element_nodes = [self.fold(element_node) for element_node in node.element_nodes]
+        return node
+
+    def fold_IfNode(self, node):
+        node.cases = [
+            (self.fold(condition), self.fold(expr), should_return_null)
+            for condition, expr, should_return_null in node.cases
+        ]
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            node.else_case = (self.fold(expr), should_return_null)
+        return node
+
+    def fold_ForNode(self, node):
+        node.start_value_node = self.fold(node.start_value_node)
+        node.end_value_node = self.fold(node.end_value_node)
+        if node.step_value_node:
+            node.step_value_node = self.fold(node.step_value_node)
+        node.body_node = self.fold(node.body_node)
+        return node
+
+    def fold_WhileNode(self, node):
+        node.condition_node = self.fold(node.condition_node)
+        node.body_node = self.fold(node.body_node)
+        return node
+
+    def fold_FuncDefNode(self, node):
+        node.body_node = self.fold(node.body_node)
+        return node
+
+    def fold_CallNode(self, node):
+        node.node_to_call = self.fold(node.node_to_call)
+        node.arg_nodes = [self.fold(arg_node) for arg_node in node.arg_nodes]
+        return node
+
+    def fold_ReturnNode(self, node):
+        if node.node_to_return:
+            node.node_to_return = self.fold(node.node_to_return)
+        return node
+
+    def constant(self, node):
+        if isinstance(node, NumberNode):
+            return Number(node.tok.value)
+        if isinstance(node, StringNode):
+            return String(node.tok.value)
+        return None
+
+    def is_number(self, node):
+        '''
+        Whether node can only evaluate to a Number, if it does not fail.
+        '''
+        if isinstance(node, NumberNode):
+            return True
+        if isinstance(node, BinaryOperatorNode):
+            return node.operator.type in NUMBER_OPERATORS or (
+                node.operator.matches(Constants.TOK_KEYWORD, 'and') or node.operator.matches(Constants.TOK_KEYWORD, 'or')
+            )
+        return False
+
+    def is_small_power(self, base, exponent):
+        if not isinstance(base, Number) or not isinstance(exponent, Number):
+            return True
+        if type(base.value) is not int or type(exponent.value) is not int:
+            return True
+        return abs(base.value).bit_length() * exponent.value <= MAX_FOLDED_POWER_BITS
+
+    def literal(self, value, node):
+        '''
+        A NumberNode or StringNode for value that takes the place of node.
+        '''
+        if isinstance(value, String):
+            node_class, tok_type = StringNode, Constants.TOK_STRING
+        elif type(value.value) is int:
+            node_class, tok_type = NumberNode, Constants.TOK_INT
+        elif type(value.value) is float and math.isfinite(value.value):
+            node_class, tok_type = NumberNode, Constants.TOK_FLOAT
+        else:
+            # An infinite or complex result has no literal to stand for it
+            return node
+
+        tok = Token(tok_type, value.value, node.pos_start.idx, None, node.pos_start.source)
+        literal = node_class(tok)
+        literal.pos_start = node.pos_start
+        literal.pos_end = node.pos_end
+        return literal
@@ -2,8 +2,11 @@ from errors import InvalidSyntaxError
 from constants import Constants
 
 class NumberNode:
+    __slots__ = ('tok', 'constant', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
+        self.constant = None
 
         self.pos_start=self.tok.pos_start
         self.pos_end=self.tok.pos_end
@@ -13,8 +16,11 @@ class NumberNode:
     
     
 class StringNode:
+    __slots__ = ('tok', 'constant', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
+        self.constant = None
 
         self.pos_start=self.tok.pos_start
         self.pos_end=self.tok.pos_end
@@ -23,10 +29,13 @@ class StringNode:
         return f'{self.tok}'
 
 class BinaryOperatorNode:
+    __slots__ = ('left_node', 'right_node', 'operator', 'operation', 'pos_start', 'pos_end')
+
     def __init__(self, left_node, operator, right_node):
         self.left_node = left_node
         self.right_node = right_node
         self.operator = operator
+        self.operation = None
 
         self.pos_start=self.left_node.pos_start
         self.pos_end=self.right_node.pos_end
@@ -36,6 +45,8 @@ class BinaryOperatorNode:
 
 
 class UnaryOperatorNode:
+    __slots__ = ('operator', 'node', 'pos_start', 'pos_end')
+
     def __init__(self, operator, node):
         self.operator = operator
         self.node = node
@@ -48,23 +59,32 @@ class UnaryOperatorNode:
 
 
 class VarAccessNode:
+    __slots__ = ('var_name_tok', 'slot', 'cache', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok):
         self.var_name_tok = var_name_tok
+        self.slot = None
+        self.cache = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
 
 
 class VarAssignNode:
+    __slots__ = ('var_name_tok', 'value_node', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, value_node):
         self.var_name_tok = var_name_tok
         self.value_node = value_node
+        self.slot = None
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
 
 
 
 class IfNode:
+    __slots__ = ('cases', 'else_case', 'pos_start', 'pos_end')
+
     def __init__(self, cases, else_case):
         self.cases = cases
         self.else_case = else_case
@@ -74,6 +94,8 @@ class IfNode:
 
 
 class ForNode:
+    __slots__ = ('var_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'should_return_null', 'slot', 'is_statement', 'has_pure_body', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node, should_return_null):
         self.var_name_tok = var_name_tok
         self.start_value_node = start_value_node
@@ -81,10 +103,15 @@ class ForNode:
         self.step_value_node = step_value_node
         self.body_node = body_node
         self.should_return_null=should_return_null
+        self.slot = None
+        self.is_statement = False
+        self.has_pure_body = False
         self.pos_start= self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
 
 class WhileNode:
+    __slots__ = ('condition_node', 'body_node', 'should_return_null', 'pos_start', 'pos_end')
+
     def __init__(self, condition_node, body_node, should_return_null):
         self.condition_node = condition_node
         self.body_node = body_node
@@ -94,11 +121,15 @@ class WhileNode:
 
 
 class FuncDefNode:
+    __slots__ = ('var_name_tok', 'arg_name_toks', 'body_node', 'should_auto_return', 'slot', 'layout', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, arg_name_toks, body_node, should_auto_return):
         self.var_name_tok = var_name_tok
         self.arg_name_toks=  arg_name_toks
         self.body_node = body_node
         self.should_auto_return=should_auto_return
+        self.slot = None
+        self.layout = None
         if self.var_name_tok:
             self.pos_start = self.var_name_tok.pos_start
         elif len(self.arg_name_toks)>0:
@@ -111,9 +142,12 @@ class FuncDefNode:
 
 
 class CallNode:
+    __slots__ = ('node_to_call', 'arg_nodes', 'checked_arg_names', 'pos_start', 'pos_end')
+
     def __init__(self, node_to_call, arg_nodes):
         self.node_to_call = node_to_call
         self.arg_nodes = arg_nodes
+        self.checked_arg_names = None
 
         self.pos_start = self.node_to_call.pos_start
 
@@ -126,14 +160,18 @@ class CallNode:
 
 
 class ListNode:
+    __slots__ = ('element_nodes', 'is_statement', 'pos_start', 'pos_end')
+
     def __init__(self, element_nodes, pos_start, pos_end):
         self.element_nodes = element_nodes
+        self.is_statement = False
         self.pos_start= pos_start
         self.pos_end = pos_end
-        super().__init__()
 
 
 class ReturnNode:
+    __slots__ = ('node_to_return', 'pos_start', 'pos_end')
+
     def __init__(self, node_to_return, pos_start, pos_end):
         self.node_to_return = node_to_return
 
@@ -141,17 +179,59 @@ class ReturnNode:
         self.pos_end = pos_end
 
 class ContinueNode:
+    __slots__ = ('pos_start', 'pos_end')
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
         self.pos_end = pos_end
 
 class BreakNode:
+    __slots__ = ('pos_start', 'pos_end')
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
         self.pos_end = pos_end
 
 
 
+def iter_child_nodes(node):
+    if isinstance(node, BinaryOperatorNode):
+        return [node.left_node, node.right_node]
+    if isinstance(node, UnaryOperatorNode):
+        return [node.node]
+    if isinstance(node, VarAssignNode):
+        return [node.value_node]
+    if isinstance(node, ListNode):
+        return node.element_nodes
+    if isinstance(node, IfNode):
+        nodes = []
+        for condition, expr, _ in node.cases:
+            nodes += [condition, expr]
+        if node.else_case:
+            nodes.append(node.else_case[0])
+        return nodes
+    if isinstance(node, ForNode):
+        return [node.start_value_node, node.end_value_node, node.step_value_node, node.body_node]
+    if isinstance(node, WhileNode):
+        return [node.condition_node, node.body_node]
+    if isinstance(node, CallNode):
+        return [node.node_to_call] + node.arg_nodes
+    if isinstance(node, ReturnNode):
+        return [node.node_to_return]
+    return []
+
+def walk(node):
+    '''
+    Yields node and every node below it, without descending into the bodies
+    of nested function definitions.
+    '''
+    yield node
+    for child in iter_child_nodes(node):
+        if child is not None:
+            yield from walk(child)
+
+
+
 
 
 
@@ -202,16 +282,54 @@ class ParseResult:
 
 
 
+# How tightly each binary operator binds. The right operand of an operator
+# is parsed one level up, except for '^', whose right operand may itself
+# contain '^', so it groups to the right. Unary '+' and '-' apply to a
+# power and unary 'not' to a comparison.
+AND_OR_LEVEL = 1
+COMPARISON_LEVEL = 2
+POW_LEVEL = 5
+
+BINARY_OPERATOR_LEVELS = {
+    (Constants.TOK_KEYWORD, 'and'): AND_OR_LEVEL,
+    (Constants.TOK_KEYWORD, 'or'): AND_OR_LEVEL,
+    Constants.TOK_EE: COMPARISON_LEVEL,
+    Constants.TOK_NE: COMPARISON_LEVEL,
+    Constants.TOK_LT: COMPARISON_LEVEL,
+    Constants.TOK_GT: COMPARISON_LEVEL,
+    Constants.TOK_LTE: COMPARISON_LEVEL,
+    Constants.TOK_GTE: COMPARISON_LEVEL,
+    Constants.TOK_PLUS: 3,
+    Constants.TOK_MINUS: 3,
+    Constants.TOK_MULTIPLY: 4,
+    Constants.TOK_DIVIDE: 4,
+    Constants.TOK_POW: POW_LEVEL,
+}
+
+
+
+
 class Parser:
+    '''
+    tokens can be any iterable, including Lexer.iter_tokens(). Tokens are
+    pulled from it as the parser reaches them and kept in self.buffer so
+    reverse() can step back over them. iter_statements drops the tokens of
+    each top level statement once it has been parsed.
+
+    Results are not memoized. The parser only steps back over an optional
+    return value or a statement that failed at the end of a block, and
+    neither is parsed again by the same rule.
+    '''
     def __init__(self, tokens):
-        self.tokens = tokens
+        self.tokens = iter(tokens)
+        self.buffer = []
+        self.buffer_start = 0
         self.tok_idx = -1
         self.advance()
 
     def advance(self):
         self.tok_idx += 1
-        if self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        self.update_current_tok()
         return self.current_tok
 
     def reverse(self, amount = 1):
@@ -220,8 +338,18 @@ class Parser:
         return self.current_tok
     
     def update_current_tok(self):
-        if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        idx = self.tok_idx - self.buffer_start
+        while idx >= len(self.buffer):
+            tok = next(self.tokens, None)
+            if tok is None:
+                return
+            self.buffer.append(tok)
+        if idx >= 0:
+            self.current_tok = self.buffer[idx]
+
+    def forget_tokens(self):
+        del self.buffer[:self.tok_idx - self.buffer_start]
+        self.buffer_start = self.tok_idx
 
     def parse(self):
         res = self.statements()
@@ -232,6 +360,41 @@ class Parser:
                 'Expected +, -, * or /'
             ))
         return res
+
+    def iter_statements(self):
+        '''
+        Parses the same program as parse(), but yields a ParseResult for
+        each top level statement as soon as it has been parsed. The last
+        result has the error if there is one.
+        '''
+        while self.current_tok.type == Constants.TOK_NEWLINE:
+            self.advance()
+
+        res = self.statement()
+        yield res
+        if res.error:
+            return
+
+        while True:
+            self.forget_tokens()
+            newline_count = 0
+            while self.current_tok.type == Constants.TOK_NEWLINE:
+                self.advance()
+                newline_count += 1
+            if newline_count == 0:
+                break
+
+            res = self.statement()
+            if res.error:
+                self.reverse(res.advance_count)
+                break
+            yield res
+
+        if self.current_tok.type != Constants.TOK_EOF:
+            yield ParseResult().failure(InvalidSyntaxError(
+                self.current_tok.pos_start, self.current_tok.pos_end,
+                'Expected +, -, * or /'
+            ))
     
     
     def statement(self):
@@ -308,90 +471,67 @@ class Parser:
             ))
     
     
-    def atom(self):
-        res= ParseResult()
+    def atom(self, res):
         tok = self.current_tok
-        
-        if tok.type == Constants.TOK_IDENTIFIER:
-            res.register_advancement()
-            self.advance()
-            return res.success(VarAccessNode(tok))
-
-
-        elif tok.type in (Constants.TOK_INT, Constants.TOK_FLOAT):
-            res.register_advancement()
-            self.advance()
-            return res.success(NumberNode(tok))
-        
-        elif tok.type == Constants.TOK_STRING:
-            res.register_advancement()
-            self.advance()
-            return res.success(StringNode(tok))
-
-        
 
-        elif tok.type == Constants.TOK_LPAREN:
+        if tok.type == Constants.TOK_LPAREN:
             res.register_advancement()
             self.advance()
             expr = res.register(self.expr())
 
             if res.error:
-                return res
+                return None
             if self.current_tok.type == Constants.TOK_RPAREN:
                 res.register_advancement()
                 self.advance()
-                return res.success(expr)
+                return expr
             else:
-                return res.failure(InvalidSyntaxError(
+                res.failure(InvalidSyntaxError(
                     self.current_tok.pos_start, self.current_tok.pos_end,
                     'Expected \')\''
                 ))
+                return None
                 
         elif tok.type == Constants.TOK_LSQUARE:
-            list_expr = res.register(self.list_expr())
-            if res.error: return res
-            return res.success(list_expr)
+            return res.register(self.list_expr())
 
-        
         elif tok.matches(Constants.TOK_KEYWORD, 'if'):
-            if_expr = res.register(self.if_expr())
-            if res.error:
-                return res
-            return res.success(if_expr)
+            return res.register(self.if_expr())
 
         elif tok.matches(Constants.TOK_KEYWORD, 'for'):
-            for_expr = res.register(self.for_expr())
-            if res.error:
-                return res
-            return res.success(for_expr)
+            return res.register(self.for_expr())
 
         elif tok.matches(Constants.TOK_KEYWORD, 'while'):
-            while_expr = res.register(self.while_expr())
-            if res.error:
-                return res
-            return res.success(while_expr)
+            return res.register(self.while_expr())
 
         elif tok.matches(Constants.TOK_KEYWORD, 'func'):
-            func_def = res.register(self.func_def())
-            if res.error:
-                return res
-            return res.success(func_def)
-        
+            return res.register(self.func_def())
 
-        return res.failure(InvalidSyntaxError(
+        res.failure(InvalidSyntaxError(
             tok.pos_start, tok.pos_end,
             'Expected int, float, +, -, *, /. keywords - if, for, while, func etc.'
         ))
+        return None
 
 
-    def power(self):
-        return self.binary_operation(self.call,(Constants.TOK_POW,), self.factor)
-
+    def call(self, res):
+        tok = self.current_tok
 
-    def call(self):
-        res = ParseResult()
-        atom = res.register(self.atom())
-        if res.error: return res
+        if tok.type == Constants.TOK_IDENTIFIER:
+            res.register_advancement()
+            self.advance()
+            atom = VarAccessNode(tok)
+        elif tok.type in (Constants.TOK_INT, Constants.TOK_FLOAT):
+            res.register_advancement()
+            self.advance()
+            atom = NumberNode(tok)
+        elif tok.type == Constants.TOK_STRING:
+            res.register_advancement()
+            self.advance()
+            atom = StringNode(tok)
+        else:
+            atom = self.atom(res)
+            if res.error: return None
 
         if self.current_tok.type == Constants.TOK_LPAREN:
             res.register_advancement()
@@ -404,52 +544,30 @@ class Parser:
             else:
                 arg_nodes.append(res.register(self.expr()))
                 if res.error:
-                    return res.failure(InvalidSyntaxError(
+                    res.failure(InvalidSyntaxError(
                         self.current_tok.pos_start, self.current_tok.pos_end,
                         "Expected ')', 'VAR', 'IF', 'FOR', 'WHILE', 'FUN', int, float, identifier, '+', '-', '(' or 'NOT'"
                     ))
+                    return None
 
                 while self.current_tok.type == Constants.TOK_COMMA:
                     res.register_advancement()
                     self.advance()
 
                     arg_nodes.append(res.register(self.expr()))
-                    if res.error: return res
+                    if res.error: return None
 
                 if self.current_tok.type != Constants.TOK_RPAREN:
-                    return res.failure(InvalidSyntaxError(
+                    res.failure(InvalidSyntaxError(
                         self.current_tok.pos_start, self.current_tok.pos_end,
                         f"Expected ',' or ')'"
                     ))
+                    return None
 
                 res.register_advancement()
                 self.advance()
-            return res.success(CallNode(atom, arg_nodes))
-        return res.success(atom)
-
-
-
-
-
-
-            
-        
-    
-    def factor(self):
-        res= ParseResult()
-        tok = self.current_tok
-
-        if tok.type in (Constants.TOK_PLUS, Constants.TOK_MINUS):
-            res.register_advancement()
-            self.advance()
-            factor = res.register(self.factor())
-            if res.error:
-                return res
-            return res.success(UnaryOperatorNode(tok, factor))
-        return self.power()
-
-    def term(self):
-        return self.binary_operation(self.factor, (Constants.TOK_MULTIPLY, Constants.TOK_DIVIDE))
+            return CallNode(atom, arg_nodes)
+        return atom
 
     def expr(self):
         res = ParseResult()
@@ -483,7 +601,7 @@ class Parser:
                 return res
             return res.success(VarAssignNode(var_name, expr))
 
-        node = res.register(self.binary_operation(self.comp_expr, ((Constants.TOK_KEYWORD, 'and'), (Constants.TOK_KEYWORD, 'or'))))
+        node = self.binary_expr(res, AND_OR_LEVEL)
 
         if res.error:
             return res.failure(InvalidSyntaxError(
@@ -493,58 +611,50 @@ class Parser:
 
         return res.success(node)
 
-    def comp_expr(self):
-        res = ParseResult()
-        if self.current_tok.matches(Constants.TOK_KEYWORD, 'not'):
-            operator = self.current_tok
+    def binary_expr(self, res, min_level):
+        '''
+        Parses operators binding at least as tightly as min_level, see
+        BINARY_OPERATOR_LEVELS, by precedence climbing. Everything is
+        registered on res; on an error it is left in res and None returned.
+        '''
+        tok = self.current_tok
+
+        if tok.type in (Constants.TOK_PLUS, Constants.TOK_MINUS):
             res.register_advancement()
             self.advance()
-
-            node = res.register(self.comp_expr())
-
+            node = self.binary_expr(res, POW_LEVEL)
             if res.error:
-                return res
-            return res.success(UnaryOperatorNode(operator, node))
-
-        node = res.register(self.binary_operation(
-            self.arith_expr,
-                (Constants.TOK_EE,
-                Constants.TOK_NE,
-                Constants.TOK_LT,
-                Constants.TOK_GT,
-                Constants.TOK_LTE,
-                Constants.TOK_GTE)))
+                return None
+            node = UnaryOperatorNode(tok, node)
 
-        if res.error:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                'Expected int, float, identifier, operators'
-            ))
-
-        return res.success(node)
-
-
-    def arith_expr(self):
-        return self.binary_operation(self.term, (Constants.TOK_PLUS, Constants.TOK_MINUS))
+        elif min_level <= COMPARISON_LEVEL and tok.matches(Constants.TOK_KEYWORD, 'not'):
+            res.register_advancement()
+            self.advance()
+            node = self.binary_expr(res, COMPARISON_LEVEL)
+            if res.error:
+                return None
+            node = UnaryOperatorNode(tok, node)
 
-    def binary_operation(self,func_a, ops, func_b=None):
-        if func_b == None:
-            func_b=func_a
-        
-        res= ParseResult()
-        leftn = res.register(func_a())
-        if res.error:
-            return res
+        else:
+            node = self.call(res)
+            if res.error:
+                return None
 
-        while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
+        while True:
             operator = self.current_tok
+            if operator.type == Constants.TOK_KEYWORD:
+                level = BINARY_OPERATOR_LEVELS.get((operator.type, operator.value))
+            else:
+                level = BINARY_OPERATOR_LEVELS.get(operator.type)
+            if level is None or level < min_level:
+                return node
+
             res.register_advancement()
             self.advance()
-            rightn = res.register(func_b())
+            right_node = self.binary_expr(res, min(level + 1, POW_LEVEL))
             if res.error:
-                return res
-            leftn = BinaryOperatorNode(leftn, operator, rightn)
-        return res.success(leftn)
+                return None
+            node = BinaryOperatorNode(node, operator, right_node)
 
 
     
@@ -0,0 +1,184 @@
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+class PersistentVector:
+    '''
+    An immutable sequence. The elements are kept in a trie whose nodes hold
+    up to WIDTH children, plus a tail of up to WIDTH elements at the end
+    that have not been pushed into the trie yet. append, pop_last and extend
+    return a new vector that shares everything but the tail and the
+    O(log32 n) nodes on the path to the last leaf with this one. Nodes are
+    plain lists that are never changed once a vector uses them.
+
+    shift is the number of bits of an index the root level consumes, so
+    root[(i >> shift) & MASK] is the child that holds element i.
+    '''
+    __slots__ = ('count', 'shift', 'root', 'tail')
+
+    def __init__(self, values=()):
+        values = values if isinstance(values, list) else list(values)
+        self.count = len(values)
+        tail_start = tail_offset(self.count)
+        self.tail = values[tail_start:]
+
+        nodes = [values[i:i + WIDTH] for i in range(0, tail_start, WIDTH)]
+        self.shift = BITS
+        while len(nodes) > WIDTH:
+            nodes = [nodes[i:i + WIDTH] for i in range(0, len(nodes), WIDTH)]
+            self.shift += BITS
+        self.root = nodes
+
+    @classmethod
+    def make(cls, count, shift, root, tail):
+        vector = object.__new__(cls)
+        vector.count = count
+        vector.shift = shift
+        vector.root = root
+        vector.tail = tail
+        return vector
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        index = self.position(index)
+        return self.leaf(index)[index & MASK]
+
+    def __iter__(self):
+        for start in range(0, tail_offset(self.count), WIDTH):
+            yield from self.leaf(start)
+        yield from self.tail
+
+    def position(self, index):
+        '''
+        index as a non negative position, with the exceptions a list raises.
+        '''
+        if type(index) is not int:
+            raise TypeError(f'vector indices must be integers, not {type(index).__name__}')
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('vector index out of range')
+        return index
+
+    def leaf(self, index):
+        '''
+        The node or tail that holds the element at position index.
+        '''
+        if index >= tail_offset(self.count):
+            return self.tail
+        node = self.root
+        for level in range(self.shift, 0, -BITS):
+            node = node[(index >> level) & MASK]
+        return node
+
+    def append(self, value):
+        if len(self.tail) < WIDTH:
+            return PersistentVector.make(self.count + 1, self.shift, self.root, self.tail + [value])
+
+        # The tail is full, so it becomes the trie's last leaf
+        if (self.count >> BITS) > (1 << self.shift):
+            root = [self.root, new_path(self.shift, self.tail)]
+            shift = self.shift + BITS
+        else:
+            root = self.push_tail(self.shift, self.root, self.tail)
+            shift = self.shift
+        return PersistentVector.make(self.count + 1, shift, root, [value])
+
+    def push_tail(self, level, node, tail):
+        index = ((self.count - 1) >> level) & MASK
+        node = node[:]
+        if level == BITS:
+            child = tail
+        elif index < len(node):
+            child = self.push_tail(level - BITS, node[index], tail)
+        else:
+            child = new_path(level - BITS, tail)
+
+        if index < len(node):
+            node[index] = child
+        else:
+            node.append(child)
+        return node
+
+    def extend(self, values):
+        '''
+        Appends every element of values, filling the tail a whole chunk at a
+        time instead of copying it once per element.
+        '''
+        values = values if isinstance(values, list) else list(values)
+        vector = self
+        i = 0
+        while i < len(values):
+            room = WIDTH - len(vector.tail)
+            if room == 0:
+                vector = vector.append(values[i])
+                i += 1
+                continue
+            chunk = values[i:i + room]
+            vector = PersistentVector.make(vector.count + len(chunk), vector.shift, vector.root, vector.tail + chunk)
+            i += len(chunk)
+        return vector
+
+    def pop_last(self):
+        if self.count == 0:
+            raise IndexError('pop from empty vector')
+        if self.count == 1:
+            return PersistentVector()
+        if len(self.tail) > 1:
+            return PersistentVector.make(self.count - 1, self.shift, self.root, self.tail[:-1])
+
+        # The tail empties, so the trie's last leaf becomes the new tail
+        tail = self.leaf(self.count - 2)
+        root = self.pop_tail(self.shift, self.root)
+        shift = self.shift
+        if root is None:
+            root = []
+        elif shift > BITS and len(root) == 1:
+            root = root[0]
+            shift -= BITS
+        return PersistentVector.make(self.count - 1, shift, root, tail)
+
+    def pop_tail(self, level, node):
+        index = ((self.count - 2) >> level) & MASK
+        if level > BITS:
+            child = self.pop_tail(level - BITS, node[index])
+            if child is None:
+                return node[:index] or None
+            node = node[:]
+            node[index] = child
+            return node
+        return node[:index] or None
+
+    def remove(self, index):
+        '''
+        A vector without the element at index. Removing the last element is
+        O(log n); any other one rebuilds the vector.
+        '''
+        index = self.position(index)
+        if index == self.count - 1:
+            return self.pop_last()
+        values = list(self)
+        del values[index]
+        return PersistentVector(values)
+
+
+
+
+def tail_offset(count):
+    '''
+    The position of the first element in the tail of a vector of count
+    elements.
+    '''
+    if count == 0:
+        return 0
+    return ((count - 1) >> BITS) << BITS
+
+
+def new_path(level, node):
+    while level > 0:
+        node = [node]
+        level -= BITS
+    return node
@@ -0,0 +1,120 @@
+from constants import Constants
+from parser import VarAccessNode, VarAssignNode, ForNode, FuncDefNode, walk
+from parser import ListNode, IfNode, WhileNode, iter_child_nodes
+from parser import NumberNode, BinaryOperatorNode, UnaryOperatorNode
+
+
+PURE_OPERATORS = (
+    Constants.TOK_PLUS, Constants.TOK_MINUS, Constants.TOK_MULTIPLY,
+    Constants.TOK_EE, Constants.TOK_NE, Constants.TOK_LT,
+    Constants.TOK_GT, Constants.TOK_LTE, Constants.TOK_GTE,
+)
+
+
+class Resolver:
+    '''
+    Assigns slots to the local variables of every function body.
+
+    A function's locals are its arguments plus every name the body assigns
+    with var, for or a named func. Each gets a fixed index into the
+    SymbolTable.slots array of the call's context, and the VarAccessNode,
+    VarAssignNode, ForNode and FuncDefNode that touch it record that index
+    in node.slot. Names are looked up dynamically through the caller's
+    symbol tables, so every other name keeps slot None and is looked up by
+    name. That covers globals from main.global_symbol_table and locals of
+    calling functions. A slot that has not been written yet falls back to
+    the same lookup.
+
+    It also sets is_statement on the ForNodes and ListNodes whose value is
+    thrown away, so the interpreter can skip building their result list, and
+    has_pure_body on for loops whose single line body can neither fail nor
+    have side effects, so their result list can be computed lazily.
+    '''
+    def resolve(self, node):
+        for child in walk(node):
+            if isinstance(child, FuncDefNode):
+                self.resolve_function(child)
+        self.mark_statements(node, False)
+        return node
+
+    def resolve_function(self, node):
+        layout = {}
+        for arg_name_tok in node.arg_name_toks:
+            layout.setdefault(arg_name_tok.value, len(layout))
+
+        body_nodes = list(walk(node.body_node))
+        for child in body_nodes:
+            var_name_tok = self.assigned_name(child)
+            if var_name_tok:
+                layout.setdefault(var_name_tok.value, len(layout))
+
+        for child in body_nodes:
+            if isinstance(child, (VarAccessNode, VarAssignNode, ForNode)):
+                child.slot = layout.get(child.var_name_tok.value)
+            elif isinstance(child, FuncDefNode):
+                if child.var_name_tok:
+                    child.slot = layout[child.var_name_tok.value]
+                self.resolve_function(child)
+
+        node.layout = layout
+
+    def mark_statements(self, node, is_statement):
+        if isinstance(node, ListNode):
+            node.is_statement = is_statement
+            for element_node in node.element_nodes:
+                self.mark_statements(element_node, is_statement)
+
+        elif isinstance(node, ForNode):
+            node.is_statement = is_statement
+            node.has_pure_body = self.is_pure(node.body_node, node.var_name_tok.value)
+            for child in (node.start_value_node, node.end_value_node, node.step_value_node):
+                if child:
+                    self.mark_statements(child, False)
+            self.mark_statements(node.body_node, node.should_return_null or is_statement)
+
+        elif isinstance(node, WhileNode):
+            self.mark_statements(node.condition_node, False)
+            self.mark_statements(node.body_node, node.should_return_null)
+
+        elif isinstance(node, IfNode):
+            for condition, expr, should_return_null in node.cases:
+                self.mark_statements(condition, False)
+                self.mark_statements(expr, should_return_null or is_statement)
+            if node.else_case:
+                expr, should_return_null = node.else_case
+                self.mark_statements(expr, should_return_null or is_statement)
+
+        elif isinstance(node, FuncDefNode):
+            self.mark_statements(node.body_node, not node.should_auto_return)
+
+        else:
+            for child in iter_child_nodes(node):
+                self.mark_statements(child, False)
+
+    def is_pure(self, node, var_name):
+        '''
+        Whether node only does arithmetic and comparisons on number literals
+        and var_name, the loop variable. Division is only allowed by a
+        non-zero literal, so evaluating node can never raise an error.
+        '''
+        if isinstance(node, NumberNode):
+            return True
+        if isinstance(node, VarAccessNode):
+            return node.var_name_tok.value == var_name
+        if isinstance(node, UnaryOperatorNode):
+            return node.operator.type == Constants.TOK_MINUS and self.is_pure(node.node, var_name)
+        if isinstance(node, BinaryOperatorNode):
+            operator = node.operator
+            if operator.type == Constants.TOK_DIVIDE:
+                is_safe = isinstance(node.right_node, NumberNode) and node.right_node.tok.value != 0
+            else:
+                is_safe = operator.type in PURE_OPERATORS or (
+                    operator.matches(Constants.TOK_KEYWORD, 'and') or operator.matches(Constants.TOK_KEYWORD, 'or')
+                )
+            return is_safe and self.is_pure(node.left_node, var_name) and self.is_pure(node.right_node, var_name)
+        return False
+
+    def assigned_name(self, node):
+        if isinstance(node, (VarAssignNode, ForNode, FuncDefNode)):
+            return node.var_name_tok
+        return None
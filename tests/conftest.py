@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The interpreter's modules live at the top of the repository. Its types.py
+# would shadow the standard library's types module if the repository came
+# first on sys.path, so it is appended instead.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
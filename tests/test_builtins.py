@@ -0,0 +1,28 @@
+import main
+
+
+def run_script(path):
+    return main.run('<test>', f'run("{path}")')
+
+
+def test_run_reports_missing_script(tmp_path):
+    value, error = run_script(tmp_path / 'missing.hash')
+    assert 'Failed to load script' in error.details
+
+
+def test_run_reports_errors_inside_script(tmp_path):
+    script = tmp_path / 'failing.hash'
+    script.write_text('1 / 0\n')
+    value, error = run_script(script)
+    assert 'Failed to finish executing script' in error.details
+
+
+def test_python_error_inside_script_is_not_a_load_failure(tmp_path):
+    # Printing an int this long raises ValueError in Python
+    script = tmp_path / 'huge.hash'
+    script.write_text('output(10 ^ 5000)\n')
+    try:
+        value, error = run_script(script)
+    except ValueError as e:
+        error = e
+    assert 'Failed to load script' not in str(getattr(error, 'details', error))
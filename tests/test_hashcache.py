@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+import main
+import hashcache
+
+
+@pytest.fixture(autouse=True)
+def cache_everything(monkeypatch):
+    monkeypatch.setattr(hashcache, 'MIN_PARSE_SECONDS', 0)
+
+
+def run_from_disk(fname):
+    # Skip the in-process cache so the program comes from __hashcache__
+    main.parse_cache.clear()
+    value, error = main.run(fname)
+    assert error is None
+    return str(value)
+
+
+def test_folded_program_runs_again_from_cache(tmp_path):
+    script = tmp_path / 'folded.hash'
+    script.write_text('var x = 2 * 3\nx + -(-4)\n"a" + "b"\n')
+
+    assert run_from_disk(str(script)) == '6, 10, ab'
+    assert os.listdir(tmp_path / hashcache.CACHE_DIR)
+    assert run_from_disk(str(script)) == '6, 10, ab'
+
+
+def test_unreadable_cache_file_is_a_miss(tmp_path):
+    script = tmp_path / 'broken.hash'
+    script.write_text('1 + 1\n')
+    run_from_disk(str(script))
+
+    cache_dir = tmp_path / hashcache.CACHE_DIR
+    for name in os.listdir(cache_dir):
+        (cache_dir / name).write_bytes(b'not a pickle')
+    assert run_from_disk(str(script)) == '2'
+
+
+def test_store_removes_other_versions(tmp_path):
+    script = tmp_path / 'script.hash'
+    script.write_text('1 + 1\n')
+    cache_dir = tmp_path / hashcache.CACHE_DIR
+    cache_dir.mkdir()
+    kept = ['script.hash.0123456789abcdef.unfolded.pickle', 'other.hash.0123456789abcdef.pickle']
+    for name in kept + ['script.hash.0123456789abcdef.pickle']:
+        (cache_dir / name).write_bytes(b'')
+
+    run_from_disk(str(script))
+    assert sorted(os.listdir(cache_dir)) == sorted(kept + [os.path.basename(hashcache.cache_path(str(script)))])
+
+
+def test_quick_parse_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashcache, 'MIN_PARSE_SECONDS', 60)
+    script = tmp_path / 'small.hash'
+    script.write_text('1 + 1\n')
+    assert run_from_disk(str(script)) == '2'
+    assert not os.path.exists(tmp_path / hashcache.CACHE_DIR)
+
+
+@pytest.mark.parametrize('module', hashcache.AST_MODULES)
+def test_changing_a_module_invalidates_the_cache(tmp_path, monkeypatch, module):
+    script = tmp_path / 'script.hash'
+    script.write_text('var x = 2 * 3\nx + 1\n')
+    run_from_disk(str(script))
+    old_path = hashcache.cache_path(str(script))
+    assert os.path.exists(old_path)
+
+    package_dir = tmp_path / 'package'
+    package_dir.mkdir()
+    source_dir = os.path.dirname(os.path.abspath(hashcache.__file__))
+    for name in hashcache.AST_MODULES:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            (package_dir / name).write_bytes(f.read())
+    assert hashcache.interpreter_version(str(package_dir)) == hashcache.INTERPRETER_VERSION
+
+    with open(package_dir / module, 'a') as f:
+        f.write('\n# changed\n')
+    version = hashcache.interpreter_version(str(package_dir))
+    assert version != hashcache.INTERPRETER_VERSION
+
+    # The old file no longer matches, so the script is parsed again and the
+    # old file is replaced by one for the new version.
+    monkeypatch.setattr(hashcache, 'INTERPRETER_VERSION', version)
+    assert hashcache.load(old_path, hashcache.source_digest(script.read_text()), None) is None
+    assert run_from_disk(str(script)) == '6, 7'
+    assert os.listdir(tmp_path / hashcache.CACHE_DIR) == [os.path.basename(hashcache.cache_path(str(script)))]
@@ -0,0 +1,17 @@
+import main
+from interpreter import Interpreter
+
+
+def test_function_without_locals_takes_the_slot_path(monkeypatch):
+    calls = []
+    call_function = Interpreter.call_function
+
+    def counting_call_function(self, func, args, node, context):
+        calls.append(func.name)
+        return call_function(self, func, args, node, context)
+
+    monkeypatch.setattr(Interpreter, 'call_function', counting_call_function)
+    value, error = main.run('<test>', 'func answer() -> 42\nanswer()\n')
+    assert error is None
+    assert str(value) == '<function answer>, 42'
+    assert calls == ['answer']
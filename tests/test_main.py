@@ -0,0 +1,28 @@
+import sys
+
+import main
+import lexer
+
+
+def test_missing_script_is_reported_on_one_line(tmp_path, monkeypatch, capsys):
+    fname = str(tmp_path / 'missing.hash')
+    monkeypatch.setattr(sys, 'argv', ['main.py', fname])
+    main.main()
+    out = capsys.readouterr().out
+    assert out.startswith(f'Failed to load script "{fname}": ')
+    assert out.count('\n') == 1
+
+
+def test_mapped_script_outlives_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexer, 'MMAP_MIN_SIZE', 1)
+    script = tmp_path / 'mapped.hash'
+    script.write_text('func f(x) -> x / 0\n' + '1\n' * 1000 + 'f(1)\n')
+
+    key, node, error = main.load(str(script), fold_constants=False)
+    assert error is None
+    # Reading a truncated file through a map that was still open would
+    # crash the process
+    script.write_text('')
+    value, error = main.execute(key, node)
+    assert error.details == 'Division by zero'
+    assert 'func f(x) -> x / 0' in error.as_string()
@@ -0,0 +1,31 @@
+import main
+
+
+def test_illegal_character_mid_stream(capsys):
+    value, error = main.run_stream('<stdin>', ['output(1)\n', '$\n', 'output(2)\n'])
+    assert value is None
+    assert error.error_name == 'Illegal Character'
+    assert error.pos_start.ln == 1
+    # Statements before the error have already run, the ones after never do
+    assert capsys.readouterr().out == '1\n'
+
+
+def test_illegal_character_at_end_of_stream():
+    value, error = main.run_stream('<stdin>', ['output(1)\n$\n'])
+    assert error.error_name == 'Illegal Character'
+
+
+def test_empty_chunk_does_not_end_stream(capsys):
+    value, error = main.run_stream('<stdin>', ['output(1)\n', '', '2 + 1\n'])
+    assert error is None
+    assert capsys.readouterr().out == '1\n'
+    # Only the last statement's value is kept
+    assert str(value) == '3'
+
+
+def test_error_in_function_from_an_earlier_chunk():
+    chunks = ['func f(x) -> x / 0\n'] + ['1\n'] * 100 + ['f(1)\n']
+    value, error = main.run_stream('<stdin>', chunks)
+    assert error.details == 'Division by zero'
+    assert error.pos_start.ln == 0
+    assert 'func f(x) -> x / 0' in error.as_string()
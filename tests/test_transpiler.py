@@ -0,0 +1,48 @@
+import main
+import transpiler
+
+
+def nested_loops(depth, body, count=2):
+    lines = ['var c = 0']
+    lines += ['  ' * k + f'for i{k} = 0 to {count} then' for k in range(depth)]
+    lines.append('  ' * depth + body)
+    lines += ['  ' * k + 'end' for k in reversed(range(depth))]
+    lines.append('c')
+    return '\n'.join(lines)
+
+
+def elseif_chain(cases):
+    lines = ['var x = 150', 'var r = 0', 'if x == 0 then', '  var r = -1']
+    for i in range(1, cases):
+        lines += [f'elseif x == {i} then', f'  var r = {i * 10}']
+    lines += ['else', '  var r = 99', 'end', 'r']
+    return '\n'.join(lines)
+
+
+def run_transpiled(text):
+    '''
+    Runs text with the python backend, after checking that it is really
+    transpiled rather than run by the Interpreter fallback.
+    '''
+    key, node, error = main.load('<test>', text)
+    assert error is None
+    transpiler.transpile_program(key, node)
+    value, error = main.execute(key, node, 'python')
+    assert error is None
+    return value.elements[-1].value
+
+
+def test_ten_nested_loops():
+    assert run_transpiled(nested_loops(10, 'var c = c + 1')) == 2 ** 10
+
+
+def test_long_elseif_chain():
+    assert run_transpiled(elseif_chain(101)) == 99
+    assert run_transpiled(elseif_chain(200)) == 1500
+
+
+def test_untranspilable_program_falls_back_to_interpreter():
+    # More nested loops than CPython has blocks for
+    value, error = main.run('<test>', nested_loops(21, 'var c = c + 1', count=1), 'python')
+    assert error is None
+    assert value.elements[-1].value == 1
@@ -0,0 +1,24 @@
+import main
+
+DEPTH = 100000
+
+
+def run_vm(text):
+    value, error = main.run('<test>', text, 'vm')
+    assert error is None
+    return value.elements[-1].value
+
+
+def test_deep_recursion():
+    text = f'func s(n) -> if n == 0 then 0 else n + s(n - 1)\ns({DEPTH})'
+    assert run_vm(text) == DEPTH * (DEPTH + 1) // 2
+
+
+def test_deep_tail_calls():
+    text = f'func t(n, acc)\n  if n == 0 then return acc\n  return t(n - 1, acc + n)\nend\nt({DEPTH}, 0)'
+    assert run_vm(text) == DEPTH * (DEPTH + 1) // 2
+
+
+def test_names_stay_dynamically_scoped():
+    text = 'func f() -> x\nfunc g(x) -> f()\ng(5)'
+    assert run_vm(text) == 5
@@ -0,0 +1,603 @@
+from errors import RTError
+from constants import Constants
+from compiler import CompileError
+from interpreter import RuntimeResult, BaseFunction, Number, String, LinkedList
+from interpreter import RuntimeFailure, BreakSignal, ContinueSignal, float_range, short_circuit
+from interpreter import BINARY_OPERATIONS, KEYWORD_OPERATIONS, binary_operation
+from parser import (
+    NumberNode, VarAccessNode, VarAssignNode, BinaryOperatorNode,
+    UnaryOperatorNode, ListNode, ForNode, FuncDefNode, CallNode, walk
+)
+import hashcache
+
+
+
+
+class TranspiledFunction(BaseFunction):
+    def __init__(self, name, body, arg_names):
+        super().__init__(name)
+        self.body = body
+        self.arg_names = arg_names
+
+    def execute(self, args):
+        res = RuntimeResult()
+        exec_ctx = self.generate_new_context()
+
+        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
+        if res.should_return():
+            return res
+
+        try:
+            return res.success(self.body(exec_ctx))
+        except RuntimeFailure as failure:
+            return res.failure(failure.error)
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+
+    def copy(self):
+        copy = TranspiledFunction(self.name, self.body, self.arg_names)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+
+
+############### Runtime helpers used by the generated source ##################
+
+def _load(symbol_table, var_name, context, pos):
+    value = symbol_table.get(var_name)
+    if not value:
+        raise RuntimeFailure(RTError(pos[0], pos[1], f"\'{var_name}\' is not defined", context))
+    return value.copy().set_pos(pos[0], pos[1]).set_context(context)
+
+def _list(elements, context, pos):
+    return LinkedList(elements).set_context(context).set_pos(pos[0], pos[1])
+
+def _binop(left, right, operation, context, pos):
+    result, error = operation(left, right)
+    if error:
+        raise RuntimeFailure(error.locate(pos[2], pos[3], context))
+    return result.set_pos(pos[0], pos[1])
+
+def _negate(value, context, pos):
+    result, error = value.multiplied_by(Number(-1))
+    if error:
+        raise RuntimeFailure(error.locate(pos[2], None, context))
+    return result.set_pos(pos[0], pos[1])
+
+def _not(value, context, pos):
+    result, error = value.notted()
+    if error:
+        raise RuntimeFailure(error.locate(pos[2], None, context))
+    return result.set_pos(pos[0], pos[1])
+
+def _divide(left, right, context, pos):
+    if right == 0:
+        raise RuntimeFailure(RTError(pos[0], pos[1], 'Division by zero', context))
+    return left / right
+
+def _for_range(start, end, step):
+    if type(start) is int and type(end) is int and type(step) is int and step != 0:
+        return range(start, end, step)
+    return float_range(start, end, step)
+
+def _function(name, body, arg_names, context, pos):
+    return TranspiledFunction(name, body, arg_names).set_context(context).set_pos(pos[0], pos[1])
+
+def _call(value_to_call, args, context, pos):
+    value_to_call = value_to_call.copy().set_pos(pos[0], pos[1])
+    res = value_to_call.execute(args)
+    if res.error:
+        raise RuntimeFailure(res.error)
+    if res.loop_should_break:
+        raise BreakSignal()
+    if res.loop_should_continue:
+        raise ContinueSignal()
+    return res.value.copy().set_pos(pos[0], pos[1]).set_context(context)
+
+_BREAK = object()
+_CONTINUE = object()
+
+def _loop_call(value_to_call, args, context, pos):
+    '''
+    _call for a call inside a loop. A break or continue from the function
+    is returned as _BREAK or _CONTINUE for the generated code to act on,
+    instead of being raised.
+    '''
+    value_to_call = value_to_call.copy().set_pos(pos[0], pos[1])
+    res = value_to_call.execute(args)
+    if res.error:
+        raise RuntimeFailure(res.error)
+    if res.loop_should_break:
+        return _BREAK
+    if res.loop_should_continue:
+        return _CONTINUE
+    return res.value.copy().set_pos(pos[0], pos[1]).set_context(context)
+
+
+RUNTIME = {
+    '_load': _load,
+    '_list': _list,
+    '_binop': _binop,
+    '_negate': _negate,
+    '_not': _not,
+    '_divide': _divide,
+    '_for_range': _for_range,
+    '_function': _function,
+    '_call': _call,
+    '_loop_call': _loop_call,
+    '_BREAK': _BREAK,
+    '_CONTINUE': _CONTINUE,
+    '_short_circuit': short_circuit,
+    '_null': Number.null,
+    'Number': Number,
+    'String': String,
+}
+
+# The generated source passes _binop the operator's handler as a global
+# named after the operator, like _op_PLUS or _op_and.
+RUNTIME.update((f'_op_{token_type}', operation) for token_type, operation in BINARY_OPERATIONS.items())
+RUNTIME.update((f'_op_{keyword}', operation) for keyword, operation in KEYWORD_OPERATIONS.items())
+
+
+
+
+class Program:
+    '''
+    A transpiled program: the compiled Python code plus the position table
+    that maps every helper call back to the Positions of the original nodes.
+    '''
+    def __init__(self, source, positions):
+        self.source = source
+        self.positions = positions
+        try:
+            self.code = compile(source, '<hash transpiled>', 'exec')
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            # Like more nested blocks than CPython allows
+            raise CompileError(f'Transpiled source does not compile: {e}')
+
+    def run(self, context):
+        res = RuntimeResult()
+        namespace = dict(RUNTIME)
+        namespace['_P'] = self.positions
+        exec(self.code, namespace)
+
+        try:
+            return res.success(namespace['_program'](context))
+        except RuntimeFailure as failure:
+            return res.failure(failure.error)
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+
+
+program_cache = hashcache.ParseCache()
+
+def transpile_program(key, node):
+    '''
+    Programs are cached under key, the key node has in main.parse_cache,
+    which changes whenever the text of the program does. program_cache is
+    an LRU of the same size, so it holds the programs main.parse_cache
+    holds and does not grow over a long session.
+    '''
+    program = program_cache.get(key)
+    if program is None:
+        try:
+            source, positions = Transpiler().transpile(node)
+        except RecursionError:
+            raise CompileError('Program is nested too deeply to transpile')
+        program = Program(source, positions)
+        program_cache.set(key, program)
+    return program
+
+
+
+
+NATIVE_OPERATORS = {
+    Constants.TOK_PLUS: '({} + {})',
+    Constants.TOK_MINUS: '({} - {})',
+    Constants.TOK_MULTIPLY: '({} * {})',
+    Constants.TOK_POW: '({} ** {})',
+    Constants.TOK_EE: 'int({} == {})',
+    Constants.TOK_NE: 'int({} != {})',
+    Constants.TOK_LT: 'int({} < {})',
+    Constants.TOK_GT: 'int({} > {})',
+    Constants.TOK_LTE: 'int({} <= {})',
+    Constants.TOK_GTE: 'int({} >= {})',
+}
+
+
+class Transpiler:
+    '''
+    Emits Python source equivalent to a parsed program. Every intermediate
+    value goes into a temporary so evaluation order matches the Interpreter.
+    Subtrees made only of number literals and for-loop counters that the
+    body never reassigns are emitted as native Python arithmetic and only
+    wrapped in a Number where a value is needed.
+
+    Loops have no try around their body. A break or continue that comes
+    out of a call inside a loop is returned by _loop_call and acted on
+    right after the call. In a while condition, which runs inside the
+    Python loop but belongs to the loop around it, it is stored in the
+    variable named by signal_flag and passed on once the loop has exited.
+    '''
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+        self.positions = []
+        self.temp_count = 0
+        self.loop_depth = 0
+        self.signal_flag = None
+        self.native_vars = {}
+        self.in_function = False
+
+    def transpile(self, node):
+        self.emit('def _program(_ctx):')
+        self.indent += 1
+        self.emit('_st = _ctx.symbol_table')
+        value = self.expr(node)
+        self.emit(f'return {value}')
+        self.indent -= 1
+        return '\n'.join(self.lines) + '\n', self.positions
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def capture(self, emit_code):
+        '''
+        Calls emit_code and returns the lines it emitted, unindented,
+        instead of emitting them, along with what emit_code returned.
+        '''
+        lines, indent = self.lines, self.indent
+        self.lines, self.indent = [], 0
+        try:
+            result = emit_code()
+            return self.lines, result
+        finally:
+            self.lines, self.indent = lines, indent
+
+    def emit_lines(self, lines):
+        for line in lines:
+            self.emit(line)
+
+    def temp(self):
+        self.temp_count += 1
+        return f'_t{self.temp_count}'
+
+    def pos(self, node, *operands):
+        '''
+        Adds the Positions of node, followed by those of the operands whose
+        errors it reports, to the position table.
+        '''
+        entry = [node.pos_start, node.pos_end]
+        entry.extend((operand.pos_start, operand.pos_end) for operand in operands)
+        self.positions.append(tuple(entry))
+        return f'_P[{len(self.positions) - 1}]'
+
+    def assign(self, expression):
+        name = self.temp()
+        self.emit(f'{name} = {expression}')
+        return name
+
+    ############### Statements whose value is discarded ###############
+
+    def stmt(self, node):
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.stmt(element_node)
+        else:
+            self.expr(node)
+
+    ############### Expressions ###############
+
+    def expr(self, node):
+        if self.is_native(node):
+            return self.assign(f'Number({self.native(node)})')
+
+        method_name = f'expr_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_expr_method)
+        return method(node)
+
+    def no_expr_method(self, node):
+        raise CompileError(f'No expr_{type(node).__name__} method defined')
+
+    def expr_StringNode(self, node):
+        return self.assign(f'String({node.tok.value!r})')
+
+    def expr_VarAccessNode(self, node):
+        return self.assign(f'_load(_st, {node.var_name_tok.value!r}, _ctx, {self.pos(node)})')
+
+    def expr_VarAssignNode(self, node):
+        value = self.expr(node.value_node)
+        self.emit(f'_st.set({node.var_name_tok.value!r}, {value})')
+        return value
+
+    def expr_BinaryOperatorNode(self, node):
+        operator = node.operator
+        if binary_operation(operator) is None:
+            raise CompileError(f'Unsupported binary operator {operator}')
+        if operator.type == Constants.TOK_KEYWORD:
+            operation = f'_op_{operator.value}'
+        else:
+            operation = f'_op_{operator.type}'
+
+        left = self.expr(node.left_node)
+        if operator.type != Constants.TOK_KEYWORD:
+            right = self.expr(node.right_node)
+            return self.assign(f'_binop({left}, {right}, {operation}, _ctx, {self.pos(node, node.left_node, node.right_node)})')
+
+        # and / or only evaluate the right operand when the left one does not decide
+        result = self.assign(f'_short_circuit({operator.value!r}, {left})')
+        self.emit(f'if {result} is None:')
+        self.indent += 1
+        right = self.expr(node.right_node)
+        self.emit(f'{result} = _binop({left}, {right}, {operation}, _ctx, {self.pos(node, node.left_node, node.right_node)})')
+        self.indent -= 1
+        return result
+
+    def expr_UnaryOperatorNode(self, node):
+        if node.operator.type == Constants.TOK_MINUS:
+            helper = '_negate'
+        elif node.operator.matches(Constants.TOK_KEYWORD, 'not'):
+            helper = '_not'
+        else:
+            raise CompileError(f'Unsupported unary operator {node.operator}')
+
+        value = self.expr(node.node)
+        return self.assign(f'{helper}({value}, _ctx, {self.pos(node, node.node)})')
+
+    def expr_ListNode(self, node):
+        elements = [self.expr(element_node) for element_node in node.element_nodes]
+        return self.assign(f'_list([{", ".join(elements)}], _ctx, {self.pos(node)})')
+
+    def expr_IfNode(self, node):
+        result = self.temp()
+        self.emit_if_cases(node.cases, node.else_case, result)
+        return result
+
+    def emit_if_cases(self, cases, else_case, result):
+        '''
+        Emits the cases as one flat if/elif chain, so a long elseif chain
+        does not nest a level per case. A condition that needs statements
+        to work it out cannot be an elif, so it starts a new chain that is
+        skipped once result has been set by an earlier case.
+        '''
+        result_start = len(self.lines)
+        guarded = False
+        for i, (condition, expr, should_return_null) in enumerate(cases):
+            lines, test = self.capture(lambda: self.condition(condition))
+            if i == 0:
+                self.emit_lines(lines)
+                self.emit(f'if {test}:')
+            elif not lines:
+                self.emit(f'elif {test}:')
+            else:
+                if guarded:
+                    self.indent -= 1
+                guarded = True
+                self.emit(f'if {result} is None:')
+                self.indent += 1
+                self.emit_lines(lines)
+                self.emit(f'if {test}:')
+            self.indent += 1
+            self.emit_branch(expr, should_return_null, result)
+            self.indent -= 1
+
+        self.emit('else:')
+        self.indent += 1
+        if else_case:
+            expr, should_return_null = else_case
+            self.emit_branch(expr, should_return_null, result)
+        else:
+            self.emit(f'{result} = _null')
+        self.indent -= 1
+
+        if guarded:
+            self.indent -= 1
+            # A case's value is never None, so None means no case matched yet
+            self.lines.insert(result_start, '    ' * self.indent + f'{result} = None')
+
+    def emit_branch(self, expr, should_return_null, result):
+        if should_return_null:
+            self.stmt(expr)
+            self.emit(f'{result} = _null')
+        else:
+            self.emit(f'{result} = {self.expr(expr)}')
+
+    def condition(self, node):
+        if self.is_native(node):
+            return f'{self.native(node)} != 0'
+        return f'{self.expr(node)}.is_true()'
+
+    def expr_ForNode(self, node):
+        var_name = node.var_name_tok.value
+        start = self.native_or_value(node.start_value_node)
+        end = self.native_or_value(node.end_value_node)
+        step = self.native_or_value(node.step_value_node) if node.step_value_node else '1'
+        elements = None if node.should_return_null else self.assign('[]')
+
+        counter = self.temp()
+        self.emit(f'for {counter} in _for_range({start}, {end}, {step}):')
+        self.indent += 1
+        self.emit(f'_st.set({var_name!r}, Number({counter}))')
+
+        outer_native = self.native_vars.get(var_name)
+        if self.counter_is_stable(node):
+            self.native_vars[var_name] = counter
+        else:
+            self.native_vars.pop(var_name, None)
+        self.emit_loop_body(node, elements)
+        if outer_native:
+            self.native_vars[var_name] = outer_native
+        else:
+            self.native_vars.pop(var_name, None)
+
+        self.indent -= 1
+        return self.finish_loop(node, elements)
+
+    def native_or_value(self, node):
+        if self.is_native(node):
+            return self.assign(self.native(node))
+        return f'{self.expr(node)}.value'
+
+    def counter_is_stable(self, node):
+        '''
+        A for-loop counter can be read as a native Python number inside the
+        body when the body never reassigns it. Calls are only allowed inside
+        functions, because run() can rebind globals from another script.
+        '''
+        var_name = node.var_name_tok.value
+        for child in walk(node.body_node):
+            if isinstance(child, (VarAssignNode, ForNode)) and child.var_name_tok.value == var_name:
+                return False
+            if isinstance(child, FuncDefNode) and child.var_name_tok and child.var_name_tok.value == var_name:
+                return False
+            if isinstance(child, CallNode) and not self.in_function:
+                return False
+        return True
+
+    def expr_WhileNode(self, node):
+        elements = None if node.should_return_null else self.assign('[]')
+
+        outer_flag = self.signal_flag
+        if self.loop_depth:
+            self.signal_flag = self.assign('None')
+        self.emit('while True:')
+        self.indent += 1
+        self.emit(f'if not ({self.condition(node.condition_node)}):')
+        self.emit('    break')
+        flag, self.signal_flag = self.signal_flag, outer_flag
+        self.emit_loop_body(node, elements)
+        self.indent -= 1
+        if flag:
+            self.emit_signal_check(flag)
+        return self.finish_loop(node, elements)
+
+    def emit_loop_body(self, node, elements):
+        self.loop_depth += 1
+        outer_flag, self.signal_flag = self.signal_flag, None
+        if elements:
+            value = self.expr(node.body_node)
+            self.emit(f'{elements}.append({value})')
+        else:
+            self.stmt(node.body_node)
+            self.emit('pass')
+        self.signal_flag = outer_flag
+        self.loop_depth -= 1
+
+    def emit_signal_check(self, value):
+        '''
+        Emits the break or continue that value, the result of a _loop_call
+        or a signal_flag, may stand for.
+        '''
+        if self.signal_flag:
+            self.emit(f'if {value} is _BREAK or {value} is _CONTINUE:')
+            self.emit(f'    {self.signal_flag} = {value}')
+            self.emit('    break')
+        else:
+            self.emit(f'if {value} is _BREAK:')
+            self.emit('    break')
+            self.emit(f'if {value} is _CONTINUE:')
+            self.emit('    continue')
+
+    def finish_loop(self, node, elements):
+        if elements:
+            return self.assign(f'_list({elements}, _ctx, {self.pos(node)})')
+        return '_null'
+
+    def expr_BreakNode(self, node):
+        if not self.loop_depth:
+            raise CompileError('break outside of a loop')
+        if self.signal_flag:
+            self.emit(f'{self.signal_flag} = _BREAK')
+        self.emit('break')
+        return '_null'
+
+    def expr_ContinueNode(self, node):
+        if not self.loop_depth:
+            raise CompileError('continue outside of a loop')
+        if self.signal_flag:
+            self.emit(f'{self.signal_flag} = _CONTINUE')
+            self.emit('break')
+        else:
+            self.emit('continue')
+        return '_null'
+
+    def expr_ReturnNode(self, node):
+        value = self.expr(node.node_to_return) if node.node_to_return else '_null'
+        self.emit(f'return {value}' if self.in_function else 'return None')
+        return '_null'
+
+    def expr_FuncDefNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        body = self.temp()
+
+        outer_state = self.loop_depth, self.signal_flag, self.native_vars, self.in_function
+        self.loop_depth, self.signal_flag, self.native_vars, self.in_function = 0, None, {}, True
+
+        self.emit(f'def {body}(_ctx):')
+        self.indent += 1
+        self.emit('_st = _ctx.symbol_table')
+        if node.should_auto_return:
+            self.emit(f'return {self.expr(node.body_node)}')
+        else:
+            self.stmt(node.body_node)
+            self.emit('return _null')
+        self.indent -= 1
+
+        self.loop_depth, self.signal_flag, self.native_vars, self.in_function = outer_state
+
+        func_value = self.assign(f'_function({func_name!r}, {body}, {arg_names!r}, _ctx, {self.pos(node)})')
+        if func_name:
+            self.emit(f'_st.set({func_name!r}, {func_value})')
+        return func_value
+
+    def expr_CallNode(self, node):
+        value_to_call = self.expr(node.node_to_call)
+        args = [self.expr(arg_node) for arg_node in node.arg_nodes]
+        if not self.loop_depth:
+            return self.assign(f'_call({value_to_call}, [{", ".join(args)}], _ctx, {self.pos(node)})')
+        result = self.assign(f'_loop_call({value_to_call}, [{", ".join(args)}], _ctx, {self.pos(node)})')
+        self.emit_signal_check(result)
+        return result
+
+    ############### Native numbers ###############
+
+    def is_native(self, node):
+        if isinstance(node, NumberNode):
+            return True
+        if isinstance(node, VarAccessNode):
+            return node.var_name_tok.value in self.native_vars
+        if isinstance(node, BinaryOperatorNode):
+            return (
+                (node.operator.type in NATIVE_OPERATORS or node.operator.type == Constants.TOK_DIVIDE)
+                and self.is_native(node.left_node) and self.is_native(node.right_node)
+            )
+        if isinstance(node, UnaryOperatorNode):
+            return node.operator.type == Constants.TOK_MINUS and self.is_native(node.node)
+        return False
+
+    def native(self, node):
+        if isinstance(node, NumberNode):
+            # A folded literal can be negative, and -2 ** 2 is not (-2) ** 2
+            literal = repr(node.tok.value)
+            return f'({literal})' if literal.startswith('-') else literal
+        if isinstance(node, VarAccessNode):
+            return self.native_vars[node.var_name_tok.value]
+        if isinstance(node, UnaryOperatorNode):
+            return f'({self.native(node.node)} * -1)'
+
+        left = self.native(node.left_node)
+        right = self.native(node.right_node)
+        if node.operator.type == Constants.TOK_DIVIDE:
+            return f'_divide({left}, {right}, _ctx, {self.pos(node.right_node)})'
+        return NATIVE_OPERATORS[node.operator.type].format(left, right)
+
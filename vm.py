@@ -0,0 +1,278 @@
+from errors import RTError
+from compiler import OpCode
+from interpreter import Context, SymbolTable, RuntimeResult, BaseFunction, Number, LinkedList
+from interpreter import short_circuit
+
+
+LOAD_NAME = OpCode.LOAD_NAME
+LOAD_NUMBER = OpCode.LOAD_NUMBER
+LOAD_STRING = OpCode.LOAD_STRING
+LOAD_NULL = OpCode.LOAD_NULL
+STORE_NAME = OpCode.STORE_NAME
+BINARY_OP = OpCode.BINARY_OP
+UNARY_OP = OpCode.UNARY_OP
+POP = OpCode.POP
+JUMP = OpCode.JUMP
+POP_JUMP_IF_FALSE = OpCode.POP_JUMP_IF_FALSE
+BUILD_LIST = OpCode.BUILD_LIST
+FOR_PREP = OpCode.FOR_PREP
+FOR_ITER = OpCode.FOR_ITER
+SETUP_LOOP = OpCode.SETUP_LOOP
+POP_BLOCK = OpCode.POP_BLOCK
+LIST_APPEND = OpCode.LIST_APPEND
+BUILD_LOOP_LIST = OpCode.BUILD_LOOP_LIST
+BREAK = OpCode.BREAK
+CONTINUE = OpCode.CONTINUE
+MAKE_FUNCTION = OpCode.MAKE_FUNCTION
+CALL = OpCode.CALL
+RETURN = OpCode.RETURN
+END = OpCode.END
+NEW_LOOP_LIST = OpCode.NEW_LOOP_LIST
+TAIL_CALL = OpCode.TAIL_CALL
+JUMP_IF_SHORT_CIRCUIT = OpCode.JUMP_IF_SHORT_CIRCUIT
+
+
+
+
+class CompiledFunction(BaseFunction):
+    def __init__(self, name, code, arg_names, should_auto_return):
+        super().__init__(name)
+        self.code = code
+        self.arg_names = arg_names
+        self.should_auto_return = should_auto_return
+
+    def execute(self, args):
+        res = RuntimeResult()
+        exec_ctx = self.generate_new_context()
+
+        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
+        if res.should_return():
+            return res
+
+        return VM().run(self.code, exec_ctx, self)
+
+    def copy(self):
+        copy = CompiledFunction(self.name, self.code, self.arg_names, self.should_auto_return)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+
+
+class Frame:
+    '''
+    One activation of a CodeObject. function is the CompiledFunction being
+    run, or None for the program itself. pos_start and pos_end are the call
+    site, which the return value is positioned at.
+    '''
+    def __init__(self, code, context, function=None, pos_start=None, pos_end=None):
+        self.code = code
+        self.context = context
+        self.function = function
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        self.stack = []
+        self.blocks = []
+        self.pc = 0
+
+
+
+
+class VM:
+    '''
+    Executes a CodeObject against a Context. Values are the same Number,
+    String, LinkedList and function objects the Interpreter produces, so
+    builtins and error reporting behave identically.
+
+    Calls to CompiledFunctions push a Frame onto a list instead of recursing
+    in Python, so recursion depth is limited by memory rather than by
+    sys.getrecursionlimit(). A TAIL_CALL replaces the current Frame. The
+    callee's symbol table still chains to the caller's, since names are
+    scoped dynamically. A name outside SymbolTable.local_names is looked
+    up in the root table directly, so finding a global or builtin does not
+    take longer the deeper the recursion is.
+    '''
+    def run(self, code, context, function=None):
+        res = RuntimeResult()
+        frames = []
+        frame = Frame(code, context, function)
+        instructions = code.instructions
+        symbol_table = context.symbol_table
+        local_names = SymbolTable.local_names
+        stack = frame.stack
+        blocks = frame.blocks
+        pc = 0
+
+        while True:
+            op, arg, pos_start, pos_end = instructions[pc]
+            pc += 1
+
+            if op == LOAD_NAME:
+                if symbol_table.parent is not None and arg not in local_names:
+                    # Only the root can hold it, so skip the callers' tables
+                    value = symbol_table.root.get(arg)
+                else:
+                    value = symbol_table.get(arg)
+                if not value:
+                    return res.failure(RTError(
+                        pos_start, pos_end,
+                        f"\'{arg}\' is not defined",
+                        context
+                    ))
+                stack.append(value.copy().set_pos(pos_start, pos_end).set_context(context))
+
+            elif op == LOAD_NUMBER:
+                stack.append(arg)
+
+            elif op == BINARY_OP:
+                right = stack.pop()
+                result, error = arg[0](stack[-1], right)
+                if error:
+                    return res.failure(error.locate(arg[1], arg[2], context))
+                stack[-1] = result.set_pos(pos_start, pos_end)
+
+            elif op == STORE_NAME:
+                symbol_table.set(arg, stack[-1])
+
+            elif op == POP:
+                stack.pop()
+
+            elif op == POP_JUMP_IF_FALSE:
+                if not stack.pop().is_true():
+                    pc = arg
+
+            elif op == JUMP:
+                pc = arg
+
+            elif op == JUMP_IF_SHORT_CIRCUIT:
+                result = short_circuit(arg[0], stack[-1])
+                if result is not None:
+                    stack[-1] = result
+                    pc = arg[1]
+
+            elif op == FOR_ITER:
+                state = stack[-1]
+                i = state[0]
+                if i < state[1] if state[3] else i > state[1]:
+                    symbol_table.set(arg[0], Number(i))
+                    state[0] = i + state[2]
+                else:
+                    pc = arg[1]
+
+            elif op == LIST_APPEND:
+                value = stack.pop()
+                stack[blocks[-1] - arg].append(value)
+
+            elif op == CALL or op == TAIL_CALL:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                value_to_call = stack.pop()
+
+                if type(value_to_call) is not CompiledFunction or len(args) != len(value_to_call.arg_names):
+                    value_to_call = value_to_call.copy().set_pos(pos_start, pos_end)
+                    call_res = value_to_call.execute(args)
+                    if call_res.error:
+                        return res.failure(call_res.error)
+                    stack.append(call_res.value.copy().set_pos(pos_start, pos_end).set_context(context))
+                    continue
+
+                exec_ctx = Context(value_to_call.name, value_to_call.context, pos_start)
+                exec_ctx.symbol_table = SymbolTable(value_to_call.context.symbol_table)
+                for arg_name, arg_value in zip(value_to_call.arg_names, args):
+                    exec_ctx.symbol_table.set(arg_name, arg_value.set_context(exec_ctx))
+
+                if op == TAIL_CALL and frame.function:
+                    frame = Frame(value_to_call.code, exec_ctx, value_to_call, frame.pos_start, frame.pos_end)
+                else:
+                    frame.pc = pc
+                    frames.append(frame)
+                    frame = Frame(value_to_call.code, exec_ctx, value_to_call, pos_start, pos_end)
+
+                instructions = frame.code.instructions
+                context = exec_ctx
+                symbol_table = exec_ctx.symbol_table
+                stack = frame.stack
+                blocks = frame.blocks
+                pc = 0
+
+            elif op == LOAD_STRING:
+                stack.append(arg)
+
+            elif op == LOAD_NULL:
+                stack.append(Number.null)
+
+            elif op == UNARY_OP:
+                value = stack[-1]
+                if arg[0] == 'neg':
+                    value, error = value.multiplied_by(Number(-1))
+                else:
+                    value, error = value.notted()
+                if error:
+                    return res.failure(error.locate(arg[1], None, context))
+                stack[-1] = value.set_pos(pos_start, pos_end)
+
+            elif op == BUILD_LIST:
+                if arg:
+                    elements = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    elements = []
+                stack.append(LinkedList(elements).set_context(context).set_pos(pos_start, pos_end))
+
+            elif op == FOR_PREP:
+                step_value = stack.pop()
+                end_value = stack.pop()
+                start_value = stack.pop()
+                stack.append([start_value.value, end_value.value, step_value.value, step_value.value >= 0])
+
+            elif op == SETUP_LOOP:
+                blocks.append(len(stack))
+
+            elif op == POP_BLOCK:
+                blocks.pop()
+
+            elif op == BREAK or op == CONTINUE:
+                del stack[blocks[-1]:]
+                pc = arg
+
+            elif op == NEW_LOOP_LIST:
+                stack.append([])
+
+            elif op == BUILD_LOOP_LIST:
+                stack.append(LinkedList(stack.pop()).set_context(context).set_pos(pos_start, pos_end))
+
+            elif op == MAKE_FUNCTION:
+                func_name, body_code, arg_names, should_auto_return = arg
+                stack.append(
+                    CompiledFunction(func_name, body_code, arg_names, should_auto_return)
+                    .set_context(context).set_pos(pos_start, pos_end)
+                )
+
+            elif op == RETURN or op == END:
+                value = stack.pop()
+                if frame.function is None:
+                    return res.success_return(value) if op == RETURN else res.success(value)
+                if op == END and not frame.function.should_auto_return:
+                    value = Number.null
+                if not frames:
+                    return res.success(value)
+
+                call_pos_start, call_pos_end = frame.pos_start, frame.pos_end
+                frame = frames.pop()
+                instructions = frame.code.instructions
+                context = frame.context
+                symbol_table = context.symbol_table
+                stack = frame.stack
+                blocks = frame.blocks
+                pc = frame.pc
+                stack.append(value.copy().set_pos(call_pos_start, call_pos_end).set_context(context))
+
+            else:
+                raise Exception(f'Unknown opcode {op}')